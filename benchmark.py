@@ -0,0 +1,340 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import functools
+import subprocess
+import numpy as np
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler, BaseHTTPRequestHandler
+
+from ffmpeg_utils import run_ffmpeg, probe_media, peak_rss_bytes
+
+logger = logging.getLogger(__name__)
+
+# Speech-like test audio: two drifting formants, a ~4 Hz syllable envelope and a pause every 7 seconds
+SPEECH_EXPRESSION = (
+    "(sin(2*PI*(150+30*sin(2*PI*0.5*t))*t)+0.5*sin(2*PI*(450+60*sin(2*PI*0.3*t))*t))"
+    "*0.3*(0.5+0.5*sin(2*PI*4*t))*gt(mod(t,7),1.2)"
+)
+
+# Words the fake transcriber cycles through (a few of them are scorer hook words)
+FAKE_WORDS = ['crypto', 'market', 'why', 'the', 'secret', 'is', 'money', 'never', 'trade', 'today', 'tips', 'and']
+
+STAGES = ['download', 'transcribe', 'scene_index', 'segment', 'render', 'metadata', 'upload']
+
+
+def generate_source(path, duration, width, height, fps):
+    """Render a synthetic test video with speech-like audio"""
+    run_ffmpeg([
+        '-f', 'lavfi', '-i', f"testsrc2=size={width}x{height}:rate={fps}:duration={duration}",
+        '-f', 'lavfi', '-i', f"aevalsrc='{SPEECH_EXPRESSION}':s=44100:d={duration}",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-shortest', '-movflags', '+faststart', path
+    ])
+    return path
+
+
+class FakeWhisperModel:
+    def transcribe(self, audio, **options):
+        """Produce word-timestamped segments from the voiced parts of the audio"""
+        sample_rate = 16000
+        frame = sample_rate // 50
+        n_frames = len(audio) // frame
+        frames = audio[:n_frames * frame].reshape(n_frames, frame)
+        voiced = np.sqrt(np.einsum('ij,ij->i', frames, frames) / frame) > 0.02
+        
+        # Runs of voiced frames become words of at most 0.4 s
+        words = []
+        start = None
+        for i, is_voiced in enumerate(np.append(voiced, False)):
+            if is_voiced and start is None:
+                start = i
+            elif start is not None and (not is_voiced or i - start >= 20):
+                words.append((start / 50, i / 50))
+                start = i if is_voiced else None
+        
+        segments = []
+        for first in range(0, len(words), 8):
+            chunk = words[first:first + 8]
+            tokens = [
+                {'word': ' ' + FAKE_WORDS[(first + k) % len(FAKE_WORDS)], 'start': s, 'end': e, 'probability': 0.9}
+                for k, (s, e) in enumerate(chunk)
+            ]
+            tokens[-1]['word'] += '.'
+            segments.append({
+                'id': len(segments), 'seek': 0, 'start': chunk[0][0], 'end': chunk[-1][1],
+                'text': ''.join(token['word'] for token in tokens), 'words': tokens
+            })
+        return {'text': ''.join(segment['text'] for segment in segments), 'segments': segments, 'language': 'en'}
+
+
+class _RangeHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+    
+    def do_GET(self):
+        """Serve a file with single byte-range support"""
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        start, end = (int(match.group(1)), min(int(match.group(2) or size - 1), size - 1)) if match else (0, size - 1)
+        
+        self.send_response(206 if match else 200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        if match:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = f.read(min(remaining, 1 << 16))
+                if not data:
+                    break
+                self.wfile.write(data)
+                remaining -= len(data)
+
+
+class _ChatHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    
+    def log_message(self, *args):
+        pass
+    
+    def do_POST(self):
+        """Answer the prompts of VideoProcessor like a chat-completions endpoint"""
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = body['messages'][-1]['content']
+        time.sleep(self.latency)
+        
+        window = re.search(r'start between (\d+)s and (\d+)s', prompt)
+        if window:
+            lo = int(window.group(1))
+            content = [{'start_time': lo, 'end_time': lo + 60, 'reason': 'benchmark', 'suggested_title': f'Window {lo}', 'score': 5}]
+        elif 'Candidates:' in prompt:
+            count = len(re.findall(r'^\s*\[\d+\]', prompt, re.M))
+            content = [
+                {'candidate': i, 'reason': 'benchmark', 'suggested_title': f'Candidate {i}'}
+                for i in range(min(count, 5))
+            ]
+        else:
+            count = len(re.findall(r'^\s*\d+\. Segment:', prompt, re.M))
+            content = [
+                {'clip': i, 'title': f'Benchmark clip {i}', 'description': 'benchmark', 'hashtags': ['#benchmark']}
+                for i in range(count)
+            ]
+        
+        payload = json.dumps({
+            'id': 'benchmark', 'object': 'chat.completion', 'created': int(time.time()), 'model': body.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': json.dumps(content)}, 'finish_reason': 'stop'}],
+            'usage': {}
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def _serve(handler):
+    """Start an HTTP server on a free local port in a background thread"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _cpu_seconds():
+    """CPU time of this process and its finished children (ffmpeg)"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _timed(stats, name, fn):
+    """Wrap a stage function so its wall and CPU time add up under a stage name"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        wall = time.perf_counter()
+        cpu = _cpu_seconds()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stage = stats[name]
+            stage['calls'] += 1
+            stage['wall_seconds'] += time.perf_counter() - wall
+            stage['cpu_seconds'] += _cpu_seconds() - cpu
+    return wrapper
+
+
+def _children_peak_rss_bytes():
+    """Largest resident set of any finished child process, in bytes (None where unavailable)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _git_commit():
+    """Commit the benchmark ran on, if this is a git checkout"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_benchmark(args):
+    """Run one video through the whole pipeline against local fakes and return the measurements"""
+    workdir = tempfile.mkdtemp(prefix='yt2tt-bench-')
+    try:
+        source = generate_source(os.path.join(workdir, 'source.mp4'), args.duration, args.width, args.height, args.fps)
+        media_server = _serve(functools.partial(_RangeHandler, directory=workdir))
+        _ChatHandler.latency = args.llm_latency
+        chat_server = _serve(_ChatHandler)
+        
+        # Everything the run writes stays inside the work directory
+        config = {
+            'download_path': os.path.join(workdir, 'downloads'),
+            'output_path': os.path.join(workdir, 'output'),
+            'state_db': os.path.join(workdir, 'state.db'),
+            'transcript_cache_path': os.path.join(workdir, 'cache', 'transcripts'),
+            'caption_cache_path': os.path.join(workdir, 'cache', 'captions'),
+            'smart_crop_cache_path': os.path.join(workdir, 'cache', 'crops'),
+            'scene_index_path': os.path.join(workdir, 'cache', 'scenes'),
+            'openai_api_key': 'benchmark',
+            'openai_api_base': f"http://127.0.0.1:{chat_server.server_port}/v1",
+            'render_engine': args.render_engine,
+            'segment_analysis': args.segment_analysis,
+            'max_clips_per_video': args.clips,
+            'upload_delay': 0
+        }
+        if not args.whisper_model:
+            # Worker processes would load real Whisper, so every chunk of a long source stays in-process on the fake
+            config.update({'transcription_workers': 0, 'long_form_workers': 1})
+        config_path = os.path.join(workdir, 'config.json')
+        with open(config_path, 'w') as f:
+            json.dump(config, f)
+        
+        from main import YouTubeToTikTokAutomation
+        automation = YouTubeToTikTokAutomation(config_path)
+        downloader = automation.downloader
+        processor = automation.processor
+        
+        if args.whisper_model:
+            processor.config.config['whisper_model'] = args.whisper_model
+        else:
+            processor._whisper_model = FakeWhisperModel()
+        
+        source_url = f"http://127.0.0.1:{media_server.server_port}/source.mp4"
+        
+        def download_video(video_url, output_path):
+            os.makedirs(output_path, exist_ok=True)
+            return downloader.ranged.download(source_url, os.path.join(output_path, 'benchmark.mp4'))
+        
+        def upload_to_tiktok(video_path, metadata):
+            time.sleep(args.upload_latency)
+            return os.path.exists(video_path)
+        
+        stats = {name: {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0} for name in STAGES}
+        downloader.download_video = _timed(stats, 'download', download_video)
+        processor.extract_audio_and_transcribe = _timed(stats, 'transcribe', processor.extract_audio_and_transcribe)
+        processor.find_interesting_segments = _timed(stats, 'segment', processor.find_interesting_segments)
+        processor.scene_indexes.get = _timed(stats, 'scene_index', processor.scene_indexes.get)
+        processor.create_vertical_videos_with_captions = _timed(stats, 'render', processor.create_vertical_videos_with_captions)
+        processor.generate_tiktok_metadata_batch = _timed(stats, 'metadata', processor.generate_tiktok_metadata_batch)
+        automation.uploader.upload_to_tiktok = _timed(stats, 'upload', upload_to_tiktok)
+        
+        # Clip lengths are taken from the stored segments to count encoded frames
+        video_info = {
+            'channel': 'Benchmark', 'video_id': 'benchmark', 'title': 'Benchmark video',
+            'url': source_url, 'published': None
+        }
+        wall = time.perf_counter()
+        cpu = _cpu_seconds()
+        automation.process_video(video_info)
+        total_wall = time.perf_counter() - wall
+        total_cpu = _cpu_seconds() - cpu
+        
+        clips = automation.state.get_clips('benchmark')
+        clip_seconds = sum(clip['segment']['end_time'] - clip['segment']['start_time'] for clip in clips)
+        render_wall = stats['render']['wall_seconds']
+        info = probe_media(source)
+        automation.processor.close()
+        media_server.shutdown()
+        chat_server.shutdown()
+        
+        return {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'source': {
+                'duration': info['duration'], 'width': args.width, 'height': args.height, 'fps': args.fps,
+                'bytes': os.path.getsize(source)
+            },
+            'settings': {
+                'render_engine': args.render_engine, 'segment_analysis': args.segment_analysis,
+                'whisper_model': args.whisper_model or 'fake', 'llm_latency': args.llm_latency,
+                'upload_latency': args.upload_latency
+            },
+            'stages': stats,
+            'total': {'wall_seconds': total_wall, 'cpu_seconds': total_cpu},
+            'clips': len(clips),
+            'uploaded': sum(clip['stage'] == 'uploaded' for clip in clips),
+            'encode_fps': clip_seconds * 30 / render_wall if render_wall else None,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'children_peak_rss_bytes': _children_peak_rss_bytes(),
+            'llm_requests': processor.llm_stats['requests']
+        }
+    finally:
+        if args.keep:
+            logger.info(f"Kept benchmark files in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark the automation pipeline on synthetic media with local fakes")
+    parser.add_argument('--duration', type=int, default=300, help="source length in seconds")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--clips', type=int, default=3, help="max clips per video")
+    parser.add_argument('--render-engine', default='ffmpeg', choices=['ffmpeg', 'moviepy'])
+    parser.add_argument('--segment-analysis', default='prefilter', choices=['prefilter', 'map_reduce'])
+    parser.add_argument('--whisper-model', default=None, help="real Whisper model name (default: fake transcriber)")
+    parser.add_argument('--llm-latency', type=float, default=0.0, help="seconds the chat stub waits per request")
+    parser.add_argument('--upload-latency', type=float, default=0.0, help="seconds the fake upload takes")
+    parser.add_argument('--output', default=None, help="write results JSON to this file")
+    parser.add_argument('--keep', action='store_true', help="keep the generated media and outputs")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    results = run_benchmark(args)
+    
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    
+    if not results['clips']:
+        logger.error("The pipeline produced no clips, the measurements above are not comparable")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+logger = logging.getLogger(__name__)
+
+# Font files tried (in order) when the configured font is not a path
+FONT_CANDIDATES = {
+    'Arial-Bold': ['arialbd.ttf', 'Arial Bold.ttf', 'Arial-Bold.ttf', 'DejaVuSans-Bold.ttf', 'LiberationSans-Bold.ttf'],
+    'Arial': ['arial.ttf', 'Arial.ttf', 'DejaVuSans.ttf', 'LiberationSans-Regular.ttf'],
+}
+
+
+class CaptionRenderer:
+    def __init__(self, config):
+        """Initialize caption renderer with an in-memory LRU and optional on-disk cache"""
+        self.font_name = config.get('caption_font', 'Arial-Bold')
+        self.max_entries = config.get('caption_cache_size', 256)
+        self.cache_dir = config.get('caption_cache_path')
+        self.max_bytes = config.get('caption_cache_max_mb', 100) * 1024 * 1024
+        # Bytes on disk, counted by a full scan on the first write and whenever the cap is crossed
+        self.disk_bytes = None
+        self.cache = OrderedDict()
+        self.fonts = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+    
+    def render(self, text, width, fontsize=60, color=(255, 255, 255), stroke_color=(0, 0, 0), stroke_width=3):
+        """Render word-wrapped, centered caption text as an RGBA array of the given width"""
+        key = (text, self.font_name, fontsize, tuple(color), tuple(stroke_color), stroke_width, width)
+        
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return self.cache[key]
+        
+        disk_path = None
+        if self.cache_dir:
+            digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+            disk_path = os.path.join(self.cache_dir, f"{digest}.npz")
+        
+        image = None
+        if disk_path and os.path.exists(disk_path):
+            try:
+                with np.load(disk_path) as entry:
+                    image = entry['image']
+                # Touch the entry so eviction treats it as recently used
+                os.utime(disk_path)
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable caption cache entry {disk_path}: {str(e)}")
+        
+        hit = image is not None
+        if not hit:
+            image = self._rasterize(text, width, fontsize, color, stroke_color, stroke_width)
+            if disk_path:
+                self._save(disk_path, image)
+        
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.cache[key] = image
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        
+        return image
+    
+    def _save(self, disk_path, image):
+        """Write a compressed entry atomically and evict the oldest entries once the cache passes its size cap"""
+        temp_path = f"{disk_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                np.savez_compressed(f, image=image)
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, disk_path)
+        except Exception as e:
+            logger.warning(f"Could not write caption cache entry {disk_path}: {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        
+        with self.lock:
+            if self.disk_bytes is not None:
+                self.disk_bytes += size
+            scan = self.disk_bytes is None or self.disk_bytes > self.max_bytes
+        if scan:
+            self._evict(keep=disk_path)
+    
+    def _evict(self, keep=None):
+        """Remove the least recently used entries until the cache fits in its size cap"""
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.npz'):
+                    continue
+                entry_path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(entry_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+            
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if entry_path == keep:
+                    continue
+                try:
+                    os.remove(entry_path)
+                    total -= size
+                except FileNotFoundError:
+                    continue
+            self.disk_bytes = total
+    
+    def _get_font(self, fontsize):
+        """Load (and memoize) the configured font at the given size"""
+        if fontsize in self.fonts:
+            return self.fonts[fontsize]
+        
+        candidates = [self.font_name] + FONT_CANDIDATES.get(self.font_name, [])
+        font = None
+        for candidate in candidates:
+            try:
+                font = ImageFont.truetype(candidate, fontsize)
+                break
+            except (OSError, ValueError):
+                continue
+        
+        if font is None:
+            logger.warning(f"Font {self.font_name} not found, using Pillow default font")
+            try:
+                font = ImageFont.load_default(size=fontsize)
+            except TypeError:
+                font = ImageFont.load_default()
+        
+        self.fonts[fontsize] = font
+        return font
+    
+    def font_face(self):
+        """Return (family, bold, font file or None) of the configured font, for renderers that pick fonts by name"""
+        font = self._get_font(60)
+        path = getattr(font, 'path', None)
+        if isinstance(path, str) and os.path.exists(path):
+            family, style = font.getname()
+            return family, 'Bold' in style, os.path.abspath(path)
+        # Pillow's built-in fallback has no file; let the other renderer look the configured name up itself
+        family, _, style = self.font_name.partition('-')
+        return family, style.lower() == 'bold', None
+    
+    def _wrap_lines(self, text, font, max_width):
+        """Greedily wrap text into lines no wider than max_width pixels"""
+        lines = []
+        current = ''
+        for word in text.split():
+            candidate = f"{current} {word}" if current else word
+            if current and font.getlength(candidate) > max_width:
+                lines.append(current)
+                current = word
+            else:
+                current = candidate
+        if current:
+            lines.append(current)
+        return lines or ['']
+    
+    def _rasterize(self, text, width, fontsize, color, stroke_color, stroke_width):
+        """Draw the caption with Pillow and return it as an RGBA uint8 array"""
+        font = self._get_font(fontsize)
+        lines = self._wrap_lines(text, font, width - 2 * stroke_width)
+        
+        ascent, descent = font.getmetrics()
+        line_height = ascent + descent + 2 * stroke_width
+        height = line_height * len(lines)
+        
+        image = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(image)
+        for i, line in enumerate(lines):
+            x = (width - font.getlength(line)) / 2
+            draw.text(
+                (x, i * line_height + stroke_width), line, font=font,
+                fill=tuple(color) + (255,),
+                stroke_width=stroke_width, stroke_fill=tuple(stroke_color) + (255,)
+            )
+        
+        return np.asarray(image)
@@ -34,7 +34,67 @@ class Config:
             "download_path": os.getenv("DOWNLOAD_PATH", "./downloads"),
             "output_path": os.getenv("OUTPUT_PATH", "./output"),
             "clip_duration": int(os.getenv("CLIP_DURATION", "60")),
-            "max_clips_per_video": int(os.getenv("MAX_CLIPS_PER_VIDEO", "5"))
+            "max_clips_per_video": int(os.getenv("MAX_CLIPS_PER_VIDEO", "5")),
+            "render_engine": os.getenv("RENDER_ENGINE", "ffmpeg"),
+            "render_workers": int(os.getenv("RENDER_WORKERS", "2")),
+            "render_batch_max_gap": int(os.getenv("RENDER_BATCH_MAX_GAP", "30")),
+            "caption_font": os.getenv("CAPTION_FONT", "Arial-Bold"),
+            "caption_cache_size": int(os.getenv("CAPTION_CACHE_SIZE", "256")),
+            "caption_cache_path": os.getenv("CAPTION_CACHE_PATH", "./cache/captions"),
+            "caption_cache_max_mb": int(os.getenv("CAPTION_CACHE_MAX_MB", "100")),
+            "transcript_cache_path": os.getenv("TRANSCRIPT_CACHE_PATH", "./cache/transcripts"),
+            "transcript_cache_max_mb": int(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "500")),
+            "whisper_model": os.getenv("WHISPER_MODEL", "base"),
+            "transcription_workers": int(os.getenv("TRANSCRIPTION_WORKERS", "0")),
+            "long_form_threshold": int(os.getenv("LONG_FORM_THRESHOLD", "1800")),
+            "long_form_chunk_seconds": int(os.getenv("LONG_FORM_CHUNK_SECONDS", "600")),
+            "long_form_search_seconds": int(os.getenv("LONG_FORM_SEARCH_SECONDS", "30")),
+            "long_form_workers": int(os.getenv("LONG_FORM_WORKERS", "2")),
+            "pipeline": {
+                "download": 1,
+                "transcribe": 1,
+                "segment": 1,
+                "render": 1,
+                "queue_size": 1
+            },
+            "upload_delay": int(os.getenv("UPLOAD_DELAY", "2")),
+            "feed_workers": int(os.getenv("FEED_WORKERS", "16")),
+            "feed_timeout": int(os.getenv("FEED_TIMEOUT", "10")),
+            "tiktok_sessions": int(os.getenv("TIKTOK_SESSIONS", "1")),
+            "driver_max_uploads": int(os.getenv("DRIVER_MAX_UPLOADS", "20")),
+            "tiktok_upload_timeout": int(os.getenv("TIKTOK_UPLOAD_TIMEOUT", "300")),
+            "tiktok_confirm_timeout": int(os.getenv("TIKTOK_CONFIRM_TIMEOUT", "60")),
+            "tiktok_login_check_timeout": int(os.getenv("TIKTOK_LOGIN_CHECK_TIMEOUT", "10")),
+            "state_db": os.getenv("STATE_DB", "state.db"),
+            "max_video_attempts": int(os.getenv("MAX_VIDEO_ATTEMPTS", "3")),
+            "download_mode": os.getenv("DOWNLOAD_MODE", "full"),
+            "section_margin": float(os.getenv("SECTION_MARGIN", "2")),
+            "download_workers": int(os.getenv("DOWNLOAD_WORKERS", "4")),
+            "download_chunk_mb": int(os.getenv("DOWNLOAD_CHUNK_MB", "8")),
+            "llm_candidates": int(os.getenv("LLM_CANDIDATES", "10")),
+            "segment_snap_seconds": float(os.getenv("SEGMENT_SNAP_SECONDS", "3")),
+            "openai_api_base": os.getenv("OPENAI_API_BASE", ""),
+            "segment_analysis": os.getenv("SEGMENT_ANALYSIS", "prefilter"),
+            "analysis_window_seconds": int(os.getenv("ANALYSIS_WINDOW_SECONDS", "600")),
+            "analysis_concurrency": int(os.getenv("ANALYSIS_CONCURRENCY", "4")),
+            "metrics_port": int(os.getenv("METRICS_PORT", "9108")),
+            "metrics_json_path": os.getenv("METRICS_JSON_PATH", "metrics.json"),
+            "encode_profile": os.getenv("ENCODE_PROFILE", "auto"),
+            "merge_encode_profile": os.getenv("MERGE_ENCODE_PROFILE", "fast"),
+            "encode_calibration_path": os.getenv("ENCODE_CALIBRATION_PATH", "encode_calibration.json"),
+            "encode_min_ssim": float(os.getenv("ENCODE_MIN_SSIM", "0.97")),
+            "encode_max_kbps": float(os.getenv("ENCODE_MAX_KBPS", "10000")),
+            "crop_mode": os.getenv("CROP_MODE", "smart"),
+            "smart_crop_fps": float(os.getenv("SMART_CROP_FPS", "2")),
+            "smart_crop_smoothing": float(os.getenv("SMART_CROP_SMOOTHING", "1.5")),
+            "smart_crop_cache_path": os.getenv("SMART_CROP_CACHE_PATH", "./cache/crops"),
+            "smart_crop_cache_max_mb": int(os.getenv("SMART_CROP_CACHE_MAX_MB", "50")),
+            "scene_snap_seconds": float(os.getenv("SCENE_SNAP_SECONDS", "1.5")),
+            "scene_fps": float(os.getenv("SCENE_FPS", "5")),
+            "scene_threshold": float(os.getenv("SCENE_THRESHOLD", "0.12")),
+            "scene_index_path": os.getenv("SCENE_INDEX_PATH", "./cache/scenes"),
+            "workspace_max_mb": int(os.getenv("WORKSPACE_MAX_MB", "20000")),
+            "scratch_path": os.getenv("SCRATCH_PATH", "")
         }
         
         if os.path.exists(config_file):
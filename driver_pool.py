@@ -0,0 +1,89 @@
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class DriverSession:
+    def __init__(self, slot, profile_dir):
+        """One browser slot with its own Chrome profile"""
+        self.slot = slot
+        self.profile_dir = profile_dir
+        self.driver = None
+        self.uploads = 0
+        self.failed = False
+
+
+class DriverPool:
+    def __init__(self, create_driver, prepare_driver, profile_dirs, max_uploads=20):
+        """Keep one warm, logged-in browser per profile and hand them out to uploads"""
+        self.create_driver = create_driver
+        self.prepare_driver = prepare_driver
+        self.max_uploads = max_uploads
+        self.sessions = [DriverSession(slot, profile_dir) for slot, profile_dir in enumerate(profile_dirs)]
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        for session in self.sessions:
+            self.idle.put(session)
+    
+    @contextmanager
+    def session(self):
+        """Borrow a healthy, logged-in browser session for the duration of the block"""
+        session = self.idle.get()
+        try:
+            self._ensure_ready(session)
+            yield session
+        except Exception:
+            session.failed = True
+            raise
+        finally:
+            self._release(session)
+    
+    def _is_healthy(self, session):
+        """Check that the browser still responds"""
+        try:
+            session.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+    
+    def _ensure_ready(self, session):
+        """Start (or restart) the browser of a session and make sure it is logged in"""
+        if session.driver is not None and not self._is_healthy(session):
+            logger.warning(f"Browser session {session.slot} is unresponsive, restarting it")
+            self._quit(session)
+        
+        if session.driver is None:
+            logger.info(f"Starting browser session {session.slot} ({session.profile_dir})")
+            session.driver = self.create_driver(session.profile_dir)
+            session.uploads = 0
+            if not self.prepare_driver(session.driver):
+                self._quit(session)
+                raise RuntimeError(f"Browser session {session.slot} could not log in")
+    
+    def _release(self, session):
+        """Return a session to the pool, recycling it after a failure or too many uploads"""
+        session.uploads += 1
+        if session.failed or session.uploads >= self.max_uploads:
+            reason = 'failure' if session.failed else f'{session.uploads} uploads'
+            logger.info(f"Recycling browser session {session.slot} after {reason}")
+            self._quit(session)
+        session.failed = False
+        self.idle.put(session)
+    
+    def _quit(self, session):
+        """Close the browser of a session"""
+        if session.driver is not None:
+            try:
+                session.driver.quit()
+            except Exception as e:
+                logger.warning(f"Error closing browser session {session.slot}: {str(e)}")
+            session.driver = None
+    
+    def close(self):
+        """Close every browser in the pool"""
+        with self.lock:
+            for session in self.sessions:
+                self._quit(session)
@@ -0,0 +1,185 @@
+import os
+import re
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from config import Config
+from ffmpeg_utils import get_ffmpeg_binary, run_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+CALIBRATION_FILE = 'encode_calibration.json'
+
+# Used when "auto" is selected but the host was never calibrated
+DEFAULT_PROFILE = 'balanced'
+
+# libx264 settings per profile; threads 0 lets the caller (or x264) decide
+PROFILES = {
+    'ultrafast': {'preset': 'ultrafast', 'crf': 23, 'maxrate': '8M', 'bufsize': '16M', 'gop': 60, 'threads': 0, 'audio_bitrate': '128k'},
+    'fast': {'preset': 'veryfast', 'crf': 23, 'maxrate': '6M', 'bufsize': '12M', 'gop': 60, 'threads': 0, 'audio_bitrate': '128k'},
+    'balanced': {'preset': 'faster', 'crf': 22, 'maxrate': '6M', 'bufsize': '12M', 'gop': 60, 'threads': 0, 'audio_bitrate': '128k'},
+    'quality': {'preset': 'medium', 'crf': 20, 'maxrate': '8M', 'bufsize': '16M', 'gop': 60, 'threads': 0, 'audio_bitrate': '160k'},
+}
+
+
+def load_calibration(path=CALIBRATION_FILE):
+    """Return the stored calibration result, or None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable encode calibration {path}: {str(e)}")
+        return None
+
+
+def resolve_profile(name, calibration_path=CALIBRATION_FILE):
+    """Return (name, settings) of an encode profile; "auto" uses this host's calibration"""
+    if name == 'auto':
+        calibration = load_calibration(calibration_path)
+        name = calibration.get('selected') if calibration else None
+        if name not in PROFILES:
+            name = DEFAULT_PROFILE
+    if name not in PROFILES:
+        logger.warning(f"Unknown encode profile {name}, using {DEFAULT_PROFILE}")
+        name = DEFAULT_PROFILE
+    return name, PROFILES[name]
+
+
+def video_args(profile, threads=None):
+    """ffmpeg output options for the video stream of a profile"""
+    threads = profile['threads'] or threads
+    return [
+        '-c:v', 'libx264',
+        '-preset', profile['preset'],
+        '-crf', str(profile['crf']),
+        '-maxrate', profile['maxrate'],
+        '-bufsize', profile['bufsize'],
+        '-g', str(profile['gop']),
+        '-pix_fmt', 'yuv420p',
+    ] + (['-threads', str(threads)] if threads else [])
+
+
+def audio_args(profile):
+    """ffmpeg output options for the audio stream of a profile"""
+    return ['-c:a', 'aac', '-b:a', profile['audio_bitrate']]
+
+
+def moviepy_kwargs(profile, threads=None):
+    """write_videofile arguments for a profile"""
+    return {
+        'codec': 'libx264',
+        'audio_codec': 'aac',
+        'audio_bitrate': profile['audio_bitrate'],
+        'preset': profile['preset'],
+        'threads': profile['threads'] or threads,
+        'ffmpeg_params': [
+            '-crf', str(profile['crf']),
+            '-maxrate', profile['maxrate'],
+            '-bufsize', profile['bufsize'],
+            '-g', str(profile['gop']),
+            '-pix_fmt', 'yuv420p',
+        ]
+    }
+
+
+def measure_ssim(encoded_path, reference_path):
+    """Return the mean SSIM of an encode against its reference"""
+    process = subprocess.run(
+        [get_ffmpeg_binary(), '-hide_banner', '-nostdin', '-i', encoded_path, '-i', reference_path,
+         '-lavfi', 'ssim', '-f', 'null', '-'],
+        capture_output=True, text=True
+    )
+    match = re.search(r'All:([0-9.]+)', process.stderr)
+    if not match:
+        raise RuntimeError(f"Could not measure SSIM of {encoded_path}")
+    return float(match.group(1))
+
+
+def calibrate(seconds=10, min_ssim=0.97, max_kbps=10000, output_path=CALIBRATION_FILE, threads=None):
+    """Encode a synthetic 9:16 sample with every profile and store the fastest one that meets the targets"""
+    workdir = tempfile.mkdtemp(prefix='encode-calibration-')
+    try:
+        # Moving test pattern with fixed grain, so the sample is neither trivial nor pure noise
+        reference = os.path.join(workdir, 'reference.mkv')
+        run_ffmpeg([
+            '-f', 'lavfi', '-i', f"testsrc2=size=1080x1920:rate=30:duration={seconds},noise=alls=2:allf=u",
+            '-f', 'lavfi', '-i', f"sine=frequency=440:duration={seconds}",
+            '-c:v', 'libx264', '-qp', '0', '-preset', 'ultrafast', '-c:a', 'flac', reference
+        ])
+        
+        results = []
+        for name, profile in PROFILES.items():
+            encoded = os.path.join(workdir, f'{name}.mp4')
+            start = time.perf_counter()
+            run_ffmpeg(['-i', reference] + video_args(profile, threads) + audio_args(profile) + [encoded])
+            elapsed = time.perf_counter() - start
+            
+            result = {
+                'profile': name,
+                'encode_seconds': round(elapsed, 3),
+                'fps': round(seconds * 30 / elapsed, 1),
+                'kbps': round(os.path.getsize(encoded) * 8 / seconds / 1000, 1),
+                'ssim': round(measure_ssim(encoded, reference), 5)
+            }
+            result['meets_target'] = result['ssim'] >= min_ssim and result['kbps'] <= max_kbps
+            logger.info(
+                f"{name}: {result['fps']} fps, {result['kbps']} kbps, SSIM {result['ssim']}"
+                + ("" if result['meets_target'] else " (misses target)")
+            )
+            results.append(result)
+        
+        passing = [result for result in results if result['meets_target']]
+        if passing:
+            selected = min(passing, key=lambda result: result['encode_seconds'])['profile']
+        else:
+            # Nothing meets the target on this host: favour quality
+            logger.warning("No encode profile meets the target, selecting the highest SSIM")
+            selected = max(results, key=lambda result: result['ssim'])['profile']
+        
+        calibration = {
+            'host': platform.node(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'target': {'min_ssim': min_ssim, 'max_kbps': max_kbps, 'sample_seconds': seconds},
+            'results': results,
+            'selected': selected
+        }
+        with open(output_path, 'w') as f:
+            json.dump(calibration, f, indent=2)
+        logger.info(f"Selected encode profile {selected}, written to {output_path}")
+        return calibration
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    """Command line entry point for calibration"""
+    parser = argparse.ArgumentParser(description="Pick the fastest encode profile that meets a quality/size target on this machine")
+    parser.add_argument('--seconds', type=int, default=10, help="length of the synthetic sample")
+    parser.add_argument('--min-ssim', type=float, default=None, help="defaults to encode_min_ssim from the config")
+    parser.add_argument('--max-kbps', type=float, default=None, help="defaults to encode_max_kbps from the config")
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--output', default=None, help="defaults to encode_calibration_path from the config")
+    parser.add_argument('--config', default='config.json')
+    args = parser.parse_args()
+    
+    config = Config(args.config)
+    min_ssim = args.min_ssim if args.min_ssim is not None else config.get('encode_min_ssim', 0.97)
+    max_kbps = args.max_kbps if args.max_kbps is not None else config.get('encode_max_kbps', 10000)
+    output_path = args.output or config.get('encode_calibration_path', CALIBRATION_FILE)
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    calibration = calibrate(args.seconds, min_ssim, max_kbps, output_path, args.threads)
+    print(json.dumps(calibration, indent=2))
+
+
+if __name__ == "__main__":
+    main()
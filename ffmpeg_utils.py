@@ -0,0 +1,138 @@
+import sys
+import re
+import subprocess
+import logging
+import threading
+import numpy as np
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+logger = logging.getLogger(__name__)
+
+
+def get_ffmpeg_binary():
+    """Return the ffmpeg binary moviepy is configured to use"""
+    return get_setting("FFMPEG_BINARY")
+
+
+def run_ffmpeg(args, timeout=None):
+    """Run ffmpeg with the given arguments, raising RuntimeError on failure"""
+    command = [get_ffmpeg_binary(), '-hide_banner', '-nostdin', '-loglevel', 'error', '-y'] + list(args)
+    logger.debug(f"Running ffmpeg: {' '.join(command)}")
+    result = subprocess.run(command, capture_output=True, timeout=timeout)
+    if result.returncode != 0:
+        stderr = result.stderr.decode('utf-8', errors='replace').strip()
+        raise RuntimeError(f"ffmpeg exited with code {result.returncode}: {stderr[-1000:]}")
+    return result
+
+
+def escape_filter_path(path):
+    """Escape a file path for use as an option value inside a -filter_complex graph"""
+    path = path.replace('\\', '/')
+    # The option parser unescapes the value after the graph parser did, so escape for both levels
+    for char in ('\\', "'", ':'):
+        path = path.replace(char, '\\' + char)
+    for char in ('\\', "'", ',', '[', ']', ';'):
+        path = path.replace(char, '\\' + char)
+    return path
+
+
+def format_ass_timestamp(seconds):
+    """Format seconds as an ASS subtitle timestamp (H:MM:SS.cc)"""
+    centiseconds = int(round(max(0, seconds) * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+
+def probe_media(path):
+    """Read stream information (duration, video_size, fps, ...) for a media file"""
+    return ffmpeg_parse_infos(path)
+
+
+def decode_audio(path, sample_rate=16000, chunk_size=1 << 20):
+    """Decode the audio track of a media file straight to mono float32 PCM in memory"""
+    command = [
+        get_ffmpeg_binary(), '-hide_banner', '-nostdin', '-loglevel', 'error',
+        '-i', path, '-vn', '-ac', '1', '-ar', str(sample_rate), '-f', 'f32le', '-'
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    
+    # Drain stderr on a separate thread so a chatty decoder can't block the stdout pipe
+    stderr_chunks = []
+    stderr_thread = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_thread.start()
+    
+    # A bytearray grows in place and gives a writable buffer without a final copy
+    pcm = bytearray()
+    while True:
+        chunk = process.stdout.read(chunk_size)
+        if not chunk:
+            break
+        pcm += chunk
+    
+    process.wait()
+    stderr_thread.join()
+    if process.returncode != 0:
+        stderr = b''.join(stderr_chunks).decode('utf-8', errors='replace').strip()
+        raise RuntimeError(f"ffmpeg exited with code {process.returncode}: {stderr[-1000:]}")
+    
+    return np.frombuffer(pcm, dtype=np.float32)
+
+
+def decode_gray_frames(path, width, height, fps, input_args=()):
+    """Yield (time, frame) pairs of a video decoded to small grayscale uint8 frames at a fixed rate"""
+    command = [
+        get_ffmpeg_binary(), '-hide_banner', '-nostdin', '-loglevel', 'error'
+    ] + list(input_args) + [
+        '-i', path, '-an', '-vf', f"fps={fps},scale={width}:{height}",
+        '-pix_fmt', 'gray', '-f', 'rawvideo', '-'
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    
+    stderr_chunks = []
+    stderr_thread = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_thread.start()
+    
+    # Frames are streamed one at a time so long sources never sit in memory whole
+    frame_size = width * height
+    index = 0
+    try:
+        while True:
+            data = process.stdout.read(frame_size)
+            if len(data) < frame_size:
+                break
+            yield index / fps, np.frombuffer(data, dtype=np.uint8).reshape(height, width)
+            index += 1
+    finally:
+        process.stdout.close()
+        process.wait()
+        stderr_thread.join()
+    if process.returncode != 0:
+        stderr = b''.join(stderr_chunks).decode('utf-8', errors='replace').strip()
+        raise RuntimeError(f"ffmpeg exited with code {process.returncode}: {stderr[-1000:]}")
+
+
+def keyframe_times(path):
+    """Return the presentation times of a video's keyframes, decoding nothing but the keyframes"""
+    command = [
+        get_ffmpeg_binary(), '-hide_banner', '-nostdin', '-skip_frame', 'nokey',
+        '-i', path, '-an', '-vf', 'showinfo', '-f', 'null', '-'
+    ]
+    result = subprocess.run(command, capture_output=True)
+    stderr = result.stderr.decode('utf-8', errors='replace')
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with code {result.returncode}: {stderr.strip()[-1000:]}")
+    return [float(match) for match in re.findall(r'\] n:\s*\d+ pts:\s*-?\d+\s+pts_time:(-?[0-9.]+)', stderr)]
+
+
+def peak_rss_bytes():
+    """Return the peak resident set size over this process's lifetime in bytes, or None if unavailable"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
@@ -0,0 +1,62 @@
+import numpy as np
+
+# Energy is measured over short frames and smoothed so that single quiet frames inside words are ignored
+FRAME_SECONDS = 0.02
+SMOOTHING_SECONDS = 0.4
+
+
+def find_split_points(audio, sample_rate, chunk_seconds, search_seconds):
+    """Return sample offsets that cut the audio roughly every chunk_seconds at the quietest nearby point"""
+    frame = int(sample_rate * FRAME_SECONDS)
+    n_frames = len(audio) // frame
+    chunk_frames = int(chunk_seconds / FRAME_SECONDS)
+    search_frames = int(search_seconds / FRAME_SECONDS)
+    if n_frames <= chunk_frames + search_frames:
+        return []
+    
+    # Per-frame RMS without materializing a squared copy of the whole signal
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    energy = np.sqrt(np.einsum('ij,ij->i', frames, frames) / frame)
+    window = max(1, int(SMOOTHING_SECONDS / FRAME_SECONDS))
+    smoothed = np.convolve(energy, np.ones(window) / window, mode='same')
+    
+    splits = []
+    target = chunk_frames
+    while target + search_frames < n_frames:
+        lo = max(target - search_frames, (splits[-1] // frame if splits else 0) + 1)
+        hi = target + search_frames
+        cut = lo + int(np.argmin(smoothed[lo:hi]))
+        splits.append(cut * frame)
+        target = cut + chunk_frames
+    return splits
+
+
+def stitch_transcriptions(results, offsets, chunk_ends):
+    """Merge per-chunk Whisper results into one result with absolute timestamps"""
+    segments = []
+    
+    # Chunks are cut at silences and don't overlap, so every word belongs to exactly one chunk
+    for result, offset, chunk_end in zip(results, offsets, chunk_ends):
+        for segment in result['segments']:
+            segment = dict(segment)
+            segment['start'] = min(segment['start'] + offset, chunk_end)
+            segment['end'] = min(segment['end'] + offset, chunk_end)
+            segment['seek'] = segment.get('seek', 0) + int(round(offset * 100))
+            
+            if 'words' in segment:
+                segment['words'] = [
+                    dict(word, start=min(word['start'] + offset, chunk_end), end=min(word['end'] + offset, chunk_end))
+                    for word in segment['words']
+                ]
+            
+            if segment['end'] <= segment['start']:
+                continue
+            
+            segment['id'] = len(segments)
+            segments.append(segment)
+    
+    return {
+        'text': ''.join(segment['text'] for segment in segments),
+        'segments': segments,
+        'language': results[0].get('language') if results else None
+    }
@@ -1,14 +1,19 @@
 import os
 import time
 import logging
+import threading
 import schedule
-from moviepy.editor import VideoFileClip
 from moviepy.config import change_settings
 
 from config import Config
 from video_downloader import VideoDownloader
 from video_processor import VideoProcessor
 from tiktok_uploader import TikTokUploader
+from pipeline import Pipeline, Stage
+from state_store import stage_reached
+from ffmpeg_utils import probe_media
+from metrics import REGISTRY, start_metrics_server
+from workspace import Workspace
 
 change_settings({"IMAGEMAGICK_BINARY": r"D:\\program files\\ImageMagick-7.1.1-Q16-HDRI\\magick.exe"})
 
@@ -23,110 +28,353 @@ class YouTubeToTikTokAutomation:
         self.downloader = VideoDownloader(self.config)
         self.processor = VideoProcessor(self.config)
         self.uploader = TikTokUploader(self.config)
+        self.state = self.downloader.state
+        self.workspace = Workspace(self.config)
+        self.jobs_lock = threading.Lock()
+    
+    def _build_pipeline(self):
+        """Create the download -> transcribe -> segment -> render -> upload pipeline"""
+        concurrency = self.config.get('pipeline', {})
+        queue_size = concurrency.get('queue_size', 1)
+        return Pipeline([
+            Stage('download', self._download_stage, concurrency.get('download', 1), queue_size,
+                  on_error=self._abort_video),
+            Stage('transcribe', self._transcribe_stage, concurrency.get('transcribe', 1), queue_size,
+                  on_error=self._abort_video),
+            Stage('segment', self._segment_stage, concurrency.get('segment', 1), queue_size,
+                  on_error=self._abort_video),
+            Stage('render', self._render_stage, concurrency.get('render', 1), queue_size,
+                  on_error=self._abort_video),
+            # The upload stage finishes its clip itself, whether the upload failed or raised
+            Stage('upload', self._upload_stage, concurrency.get('upload', self.config.get('tiktok_sessions', 1)), queue_size),
+        ])
+    
+    def _release_source(self, job):
+        """Hand the source of a video job back to the workspace (a file from outside it is deleted as before)"""
+        video_path = job.get('video_path')
+        if self.workspace.owns(video_path):
+            # Released once per job even if several cleanup paths run
+            if job.pop('source_pinned', False):
+                self.workspace.release(video_path)
+        elif video_path and os.path.exists(video_path):
+            os.remove(video_path)
+    
+    def _abort_video(self, job, error):
+        """Clean up a video job that raised inside a stage (a stored source stays for the retry)"""
+        logger.error(f"Error processing video {job['video_info']['title']}: {str(error)}")
+        self._release_source(job)
+        # Clips the render stage pinned before it raised never reach the upload stage that would release them
+        for clip_path in job.pop('pinned_clips', []):
+            self.workspace.release(clip_path)
+    
+    def _advance(self, job, stage, video_path=None):
+        """Record a completed stage of a video job (stages never move backwards)"""
+        if not stage_reached(job['stage'], stage):
+            job['stage'] = stage
+        self.state.set_stage(job['video_info']['video_id'], job['stage'], video_path)
+    
+    def _rendered_clips_available(self, job):
+        """Check that every clip not yet uploaded still has its rendered file on disk"""
+        return all(
+            clip['stage'] == 'uploaded'
+            or (clip['stage'] == 'rendered' and clip['clip_path'] and os.path.exists(clip['clip_path']))
+            for clip in self.state.get_clips(job['video_info']['video_id'])
+        )
+    
+    def _download_stage(self, job):
+        """Step 1: Download video"""
+        video_info = job['video_info']
+        logger.info(f"Processing video: {video_info['title']} (last completed stage: {job['stage']})")
         
-    def process_video(self, video_info):
-        """Process a single video through the entire pipeline"""
+        # Clips already rendered before a restart don't need the source any more
+        if stage_reached(job['stage'], 'rendered'):
+            if self._rendered_clips_available(job):
+                return [job]
+            # Some rendered files are gone: render again from the stored segments
+            job['stage'] = 'segmented'
+        
+        video_path = job.get('video_path')
+        if stage_reached(job['stage'], 'downloaded') and video_path and os.path.exists(video_path):
+            logger.info(f"Resuming with downloaded file: {video_path}")
+            if self.workspace.owns(video_path):
+                self.workspace.pin(video_path)
+                job['source_pinned'] = True
+            job['audio_only'] = not probe_media(video_path)['video_found']
+            return [job]
+        
+        # A source kept from an earlier attempt (or an earlier audio-first run) is used instead of downloading again
+        audio_first = self.config.get('download_mode', 'full') == 'audio_first'
+        key = self.workspace.key(video_info['video_id'])
+        video_path = self.workspace.lookup('source', key)
+        if not video_path and audio_first:
+            video_path = self.workspace.lookup('audio', key)
+        if video_path:
+            logger.info(f"Using stored source: {video_path}")
+            job['audio_only'] = not probe_media(video_path)['video_found']
+        else:
+            video_path = self._download_source(job, key, audio_first)
+        if not video_path:
+            logger.error(f"Failed to download video: {video_info['title']}")
+            # Mark as processed to avoid retrying failed downloads
+            self.downloader.mark_as_processed(video_info['video_id'])
+            return []
+        
+        # Looked up and stored entries come back pinned
+        job['video_path'] = video_path
+        job['source_pinned'] = True
+        self._advance(job, 'downloaded', video_path)
+        return [job]
+    
+    def _download_source(self, job, key, audio_first):
+        """Download the audio (audio-first mode) or the full video into staging and store it in the workspace"""
+        video_info = job['video_info']
+        # A download that raised keeps its staging directory so the retry can resume it; unpinned, it counts
+        # towards the budget and is evicted like any other entry if the retry never comes
+        staging = self.workspace.staging_dir(video_info['video_id'])
         try:
-            logger.info(f"Processing video: {video_info['title']}")
-            
-            # Create directories
-            os.makedirs(self.config['download_path'], exist_ok=True)
-            os.makedirs(self.config['output_path'], exist_ok=True)
-            
-            # Step 1: Download video
-            video_path = self.downloader.download_video(video_info['url'], self.config['download_path'])
-            if not video_path:
-                logger.error(f"Failed to download video: {video_info['title']}")
-                # Mark as processed to avoid retrying failed downloads
-                self.downloader.mark_as_processed(video_info['video_id'])
-                return False
-            
-            # Step 2: Transcribe video
-            transcription = self.processor.extract_audio_and_transcribe(video_path)
-            if not transcription:
-                logger.error(f"Failed to transcribe video: {video_info['title']}")
-                # Clean up downloaded file
-                if os.path.exists(video_path):
-                    os.remove(video_path)
-                return False
+            if audio_first:
+                # Transcribe and segment from the audio; only the chosen sections of the video are fetched later
+                audio_path, job['streams'] = self.downloader.download_audio(video_info['url'], staging)
+                if audio_path:
+                    job['audio_only'] = True
+                    video_path = self.workspace.store('audio', key, audio_path)
+                    self.workspace.clear_staging(video_info['video_id'])
+                    return video_path
             
-            # Step 3: Find interesting segments
-            video_clip = VideoFileClip(video_path)
-            video_duration = video_clip.duration
-            video_clip.close()
+            downloaded_path = self.downloader.download_video(video_info['url'], staging)
+            if not downloaded_path:
+                # The video is marked processed and never retried, so the partial download goes now
+                self.workspace.clear_staging(video_info['video_id'])
+                return None
+            video_path = self.workspace.store('source', key, downloaded_path)
+            self.workspace.clear_staging(video_info['video_id'])
+            return video_path
+        finally:
+            self.workspace.release(staging)
+    
+    def _transcribe_stage(self, job):
+        """Step 2: Transcribe video"""
+        if stage_reached(job['stage'], 'rendered'):
+            return [job]
+        
+        video_info = job['video_info']
+        transcription = self.processor.extract_audio_and_transcribe(job['video_path'], video_info['video_id'])
+        if not transcription:
+            logger.error(f"Failed to transcribe video: {video_info['title']}")
+            # Clean up downloaded file
+            self._release_source(job)
+            return []
+        
+        job['transcription'] = transcription
+        self._advance(job, 'transcribed')
+        return [job]
+    
+    def _segment_stage(self, job):
+        """Step 3: Find interesting segments"""
+        video_info = job['video_info']
+        
+        if not stage_reached(job['stage'], 'segmented'):
+            video_duration = probe_media(job['video_path'])['duration']
             
-            segments = self.processor.find_interesting_segments(transcription, video_duration)
+            # Shot cuts and keyframes need the picture, which an audio-only download doesn't have
+            scene_index = None
+            if not job.get('audio_only') and self.config.get('scene_snap_seconds', 1.5) > 0:
+                scene_index = self.processor.scene_indexes.get(video_info['video_id'], job['video_path'])
             
+            segments = self.processor.find_interesting_segments(job['transcription'], video_duration, scene_index)
             if not segments:
                 logger.warning(f"No interesting segments found for video: {video_info['title']}")
                 # Clean up downloaded file
-                if os.path.exists(video_path):
-                    os.remove(video_path)
+                self._release_source(job)
                 # Mark as processed
                 self.downloader.mark_as_processed(video_info['video_id'])
-                return False
+                return []
             
-            # Step 4: Create short-form videos
-            successful_uploads = 0
-            for i, segment in enumerate(segments):
-                try:
-                    logger.info(f"Creating clip {i+1}/{len(segments)}: {segment['title']}")
+            self.state.save_segments(video_info['video_id'], segments)
+            job['stage'] = 'segmented'
+        
+        job['clips'] = self.state.get_clips(video_info['video_id'])
+        job['segments'] = [clip['segment'] for clip in job['clips']]
+        return [job]
+    
+    def _render_stage(self, job):
+        """Step 4: Create short-form videos (all segments rendered from one pass over the source)"""
+        video_id = job['video_info']['video_id']
+        
+        # Every pin taken here is recorded on the job until the clips are handed to the upload stage
+        pinned = job.setdefault('pinned_clips', [])
+        # Only render clips that were not rendered (or whose file is gone) before a restart
+        to_render = [
+            clip for clip in job['clips']
+            if clip['stage'] != 'uploaded'
+            and not (clip['stage'] == 'rendered' and clip['clip_path'] and os.path.exists(clip['clip_path']))
+        ]
+        if to_render:
+            # Clips are addressed by their source, time range and render settings, so an identical render is reused
+            settings = self.processor.render_settings()
+            keys = [
+                self.workspace.key(
+                    video_id, clip['segment']['start_time'], clip['segment']['end_time'],
+                    clip['segment'].get('encode_profile'), settings
+                )
+                for clip in to_render
+            ]
+            clip_paths = [self.workspace.lookup('clip', key) for key in keys]
+            pinned.extend(clip_path for clip_path in clip_paths if clip_path)
+            pending = [i for i, clip_path in enumerate(clip_paths) if clip_path is None]
+            if len(pending) < len(to_render):
+                logger.info(f"Reusing {len(to_render) - len(pending)} stored clips for: {job['video_info']['title']}")
+            
+            if pending:
+                logger.info(f"Creating {len(pending)} clips for: {job['video_info']['title']}")
+                segments = [to_render[i]['segment'] for i in pending]
+                # Sections, subtitles and unfinished clips live in a scratch directory of this job only
+                with self.workspace.scratch(f"render-{video_id}") as scratch:
+                    if job.get('audio_only'):
+                        # Only download the parts of the video the clips need
+                        streams = job.get('streams') or self.downloader.resolve_streams(job['video_info']['url'])
+                        segments, _ = self.downloader.download_sections(
+                            streams, segments, scratch, self.config.get('section_margin', 2)
+                        )
                     
-                    # Create vertical video with captions
-                    clip_path = self.processor.create_vertical_video_with_captions(
-                        video_path, segment, transcription, self.config['output_path']
+                    rendered_paths = self.processor.create_vertical_videos_with_captions(
+                        job['video_path'], segments, job['transcription'], scratch
                     )
-                    
-                    if clip_path:
-                        # Generate metadata
-                        metadata = self.processor.generate_tiktok_metadata(video_info, segment)
-                        
-                        # Upload to TikTok
-                        if self.uploader.upload_to_tiktok(clip_path, metadata):
-                            successful_uploads += 1
-                            logger.info(f"Successfully processed clip: {segment['title']}")
-                        else:
-                            logger.warning(f"Failed to upload clip: {segment['title']}")
-                        
-                        # Clean up clip file
-                        if os.path.exists(clip_path):
-                            os.remove(clip_path)
-                        
-                        time.sleep(2)  # Brief pause between uploads
-                    else:
-                        logger.warning(f"Failed to create clip: {segment['title']}")
-                        
-                except Exception as clip_error:
-                    logger.error(f"Error processing clip {i+1}: {str(clip_error)}")
-                    continue
-            
-            # Clean up original video file
-            if os.path.exists(video_path):
-                os.remove(video_path)
+                    for i, rendered_path in zip(pending, rendered_paths):
+                        if rendered_path:
+                            clip_paths[i] = self.workspace.store('clip', keys[i], rendered_path)
+                            pinned.append(clip_paths[i])
             
-            # Mark video as processed
-            self.downloader.mark_as_processed(video_info['video_id'])
-            
-            logger.info(f"Completed processing {video_info['title']} - {successful_uploads}/{len(segments)} clips uploaded")
-            return successful_uploads > 0
+            for clip, clip_path in zip(to_render, clip_paths):
+                if clip_path:
+                    clip['stage'] = 'rendered'
+                    clip['clip_path'] = clip_path
+                    self.state.set_clip_stage(video_id, clip['clip_index'], 'rendered', clip_path)
+                else:
+                    logger.warning(f"Failed to create clip: {clip['segment']['title']}")
+        
+        # The source is no longer needed once every clip is rendered; it stays stored until the budget needs the space
+        self._release_source(job)
+        self._advance(job, 'rendered')
+        
+        rendered = [clip for clip in job['clips'] if clip['stage'] == 'rendered']
+        for clip in rendered:
+            # Clips looked up or stored above are pinned already
+            if clip['clip_path'] not in pinned and self.workspace.owns(clip['clip_path']):
+                self.workspace.pin(clip['clip_path'])
+                pinned.append(clip['clip_path'])
+        
+        # Metadata for every clip of the video comes from one AI request
+        metadata = self.processor.generate_tiktok_metadata_batch(
+            job['video_info'], [clip['segment'] for clip in rendered]
+        ) if rendered else []
+        
+        clips = [
+            {
+                'job': job, 'clip_index': clip['clip_index'], 'segment': clip['segment'],
+                'clip_path': clip['clip_path'], 'metadata': clip_metadata
+            }
+            for clip, clip_metadata in zip(rendered, metadata)
+        ]
+        
+        # Each emitted clip's pin is now released by _finish_clip; any clip left without metadata is released here
+        emitted = [clip['clip_path'] for clip in clips]
+        for clip_path in job.pop('pinned_clips'):
+            if clip_path in emitted:
+                emitted.remove(clip_path)
+            else:
+                self.workspace.release(clip_path)
+        
+        job['pending_clips'] = len(clips)
+        if not clips:
+            self._finish_video(job)
+        return clips
+    
+    def _upload_stage(self, clip):
+        """Step 5: Upload a clip with the metadata generated for its video"""
+        segment = clip['segment']
+        success = False
+        try:
+            # Upload to TikTok
+            success = self.uploader.upload_to_tiktok(clip['clip_path'], clip['metadata'])
+            if success:
+                self.state.set_clip_stage(clip['job']['video_info']['video_id'], clip['clip_index'], 'uploaded')
+                logger.info(f"Successfully processed clip: {segment['title']}")
+            else:
+                logger.warning(f"Failed to upload clip: {segment['title']}")
             
-        except Exception as e:
-            logger.error(f"Error processing video {video_info['title']}: {str(e)}")
-            # Clean up any remaining files
-            try:
-                if 'video_path' in locals() and os.path.exists(video_path):
-                    os.remove(video_path)
-            except:
-                pass
-            return False
+            time.sleep(self.config.get('upload_delay', 2))  # Brief pause between uploads
+        finally:
+            self._finish_clip(clip, success)
+        return []
+    
+    def _finish_clip(self, clip, success):
+        """Release an uploaded (or failed) clip and finish its video when it was the last one"""
+        if self.workspace.owns(clip['clip_path']):
+            self.workspace.release(clip['clip_path'])
+        elif os.path.exists(clip['clip_path']):
+            os.remove(clip['clip_path'])
+        
+        job = clip['job']
+        with self.jobs_lock:
+            if success:
+                job['successful_uploads'] += 1
+            job['pending_clips'] -= 1
+            done = job['pending_clips'] == 0
+        if done:
+            self._finish_video(job)
+    
+    def _finish_video(self, job):
+        """Mark a video as processed once all of its clips went through the upload stage"""
+        video_info = job['video_info']
+        self._advance(job, 'uploaded')
+        self.downloader.mark_as_processed(video_info['video_id'])
+        logger.info(
+            f"Completed processing {video_info['title']} - "
+            f"{job['successful_uploads']}/{len(job['segments'])} clips uploaded"
+        )
+    
+    def _run_pipeline(self, videos):
+        """Run videos through the stage pipeline and return their jobs"""
+        # Create directories
+        os.makedirs(self.config['download_path'], exist_ok=True)
+        os.makedirs(self.config['output_path'], exist_ok=True)
+        
+        jobs = []
+        for video in videos:
+            self.state.add_video(video)
+            self.state.start_attempt(video['video_id'])
+            jobs.append({
+                'video_info': video,
+                'stage': video.get('stage', 'discovered'),
+                'video_path': video.get('video_path'),
+                'successful_uploads': 0
+            })
+        
+        stats = self._build_pipeline().run(jobs)
+        for name, stage_stats in stats.items():
+            logger.info(
+                f"Stage {name}: {stage_stats['processed']} processed, {stage_stats['failed']} failed, "
+                f"{stage_stats['busy_seconds']:.1f}s busy, max queue depth {stage_stats['max_queue_depth']}"
+            )
+        return jobs
+    
+    def process_video(self, video_info):
+        """Process a single video through the entire pipeline"""
+        job = self._run_pipeline([video_info])[0]
+        return job['successful_uploads'] > 0
     
     def run_automation_cycle(self):
         """Run one cycle of the automation"""
         logger.info("Starting automation cycle...")
         
         try:
-            # Check for new videos
-            new_videos = self.downloader.check_new_videos()
+            # Resume unfinished videos from their last completed stage, then check for new ones
+            pending_videos = self.state.pending_videos(self.config.get('max_video_attempts', 3))
+            if pending_videos:
+                logger.info(f"Resuming {len(pending_videos)} unfinished videos")
+            
+            new_videos = pending_videos + self.downloader.check_new_videos()
             
             if not new_videos:
                 logger.info("No new videos found")
@@ -134,23 +382,30 @@ class YouTubeToTikTokAutomation:
             
             logger.info(f"Found {len(new_videos)} new videos")
             
-            # Process each new video
-            for video in new_videos:
-                try:
-                    self.process_video(video)
-                    # Add delay between videos to avoid rate limiting
-                    time.sleep(30)
-                except Exception as e:
-                    logger.error(f"Error processing video {video.get('title', 'unknown')}: {str(e)}")
-                    continue
-                    
+            # Stages overlap across videos: one can upload while the next renders and another downloads
+            start = time.time()
+            self._run_pipeline(new_videos)
+            logger.info(f"Processed {len(new_videos)} videos in {time.time() - start:.1f}s")
+        
         except Exception as e:
             logger.error(f"Error in automation cycle: {str(e)}")
+        finally:
+            # Snapshot of every metric so a slow cycle can be traced to its stage afterwards
+            metrics_path = self.config.get('metrics_json_path')
+            if metrics_path:
+                try:
+                    REGISTRY.dump_json(metrics_path)
+                except Exception as e:
+                    logger.warning(f"Could not write metrics to {metrics_path}: {str(e)}")
     
     def start_monitoring(self):
         """Start the monitoring system"""
         logger.info("Starting YouTube to TikTok automation system...")
         
+        # Prometheus-style scrape endpoint for per-stage latency, bytes, encode speed and queue depth
+        if self.config.get('metrics_port'):
+            start_metrics_server(self.config['metrics_port'])
+        
         # Schedule the automation to run every hour
         schedule.every().hour.do(self.run_automation_cycle)
         
@@ -164,6 +419,8 @@ class YouTubeToTikTokAutomation:
                 time.sleep(60)  # Check every minute
             except KeyboardInterrupt:
                 logger.info("Automation stopped by user")
+                self.processor.close()
+                self.uploader.close()
                 break
             except Exception as e:
                 logger.error(f"Error in monitoring loop: {str(e)}")
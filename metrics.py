@@ -0,0 +1,221 @@
+import json
+import time
+import logging
+import threading
+import functools
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a feed poll up to a long transcription
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# Encode speed buckets in output frames per second
+FPS_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 60, 120, 240)
+
+
+def _escape(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=None):
+    """Render a label set as {name="value",...}"""
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+    
+    def __init__(self, registry, name, help_text):
+        """Register a metric; its samples are keyed by their sorted label pairs"""
+        self.name = name
+        self.help = help_text
+        self.lock = threading.Lock()
+        self.samples = {}
+        registry.register(self)
+    
+    @staticmethod
+    def _key(labels):
+        """Hashable key of a label set"""
+        return tuple(sorted(labels.items()))
+
+
+class Counter(_Metric):
+    kind = 'counter'
+    
+    def inc(self, amount=1, **labels):
+        """Add to the counter"""
+        key = self._key(labels)
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+    
+    def expose(self):
+        """Sample lines in the Prometheus text format"""
+        with self.lock:
+            return [f"{self.name}{_format_labels(key)} {value}" for key, value in self.samples.items()]
+    
+    def to_dict(self):
+        """Samples as plain data"""
+        with self.lock:
+            return [{'labels': dict(key), 'value': value} for key, value in self.samples.items()]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+    
+    def set(self, value, **labels):
+        """Set the gauge to a value"""
+        with self.lock:
+            self.samples[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+    
+    def __init__(self, registry, name, help_text, buckets=SECONDS_BUCKETS):
+        """Register a histogram with cumulative upper-bound buckets"""
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(registry, name, help_text)
+    
+    def observe(self, value, **labels):
+        """Record one observation"""
+        key = self._key(labels)
+        with self.lock:
+            sample = self.samples.get(key)
+            if sample is None:
+                sample = self.samples[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample['counts'][i] += 1
+            sample['sum'] += value
+            sample['count'] += 1
+    
+    def expose(self):
+        """Bucket, sum and count lines in the Prometheus text format"""
+        lines = []
+        with self.lock:
+            for key, sample in self.samples.items():
+                for bound, count in zip(self.buckets, sample['counts']):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', bound))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {sample['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {sample['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {sample['count']}")
+        return lines
+    
+    def to_dict(self):
+        """Samples as plain data"""
+        with self.lock:
+            return [
+                {
+                    'labels': dict(key),
+                    'buckets': dict(zip(map(str, self.buckets), sample['counts'])),
+                    'sum': sample['sum'],
+                    'count': sample['count']
+                }
+                for key, sample in self.samples.items()
+            ]
+
+
+class Registry:
+    def __init__(self):
+        """Collection of metrics exposed together"""
+        self.metrics = []
+        self.lock = threading.Lock()
+    
+    def register(self, metric):
+        """Add a metric to the registry"""
+        with self.lock:
+            self.metrics.append(metric)
+    
+    def render_prometheus(self):
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+    
+    def to_dict(self):
+        """Snapshot every metric as plain data"""
+        with self.lock:
+            metrics = list(self.metrics)
+        return {
+            metric.name: {'type': metric.kind, 'help': metric.help, 'samples': metric.to_dict()}
+            for metric in metrics
+        }
+    
+    def dump_json(self, path):
+        """Write a snapshot of every metric to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump({'timestamp': time.time(), 'metrics': self.to_dict()}, f, indent=2)
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = Histogram(REGISTRY, 'stage_duration_seconds', 'Latency of each processing stage')
+STAGE_FAILURES = Counter(REGISTRY, 'stage_failures_total', 'Stage calls that raised or returned no result')
+BYTES_TRANSFERRED = Counter(REGISTRY, 'bytes_transferred_total', 'Bytes fetched over the network')
+ENCODE_FPS = Histogram(REGISTRY, 'encode_frames_per_second', 'Output frames encoded per second of render time', FPS_BUCKETS)
+FRAMES_ENCODED = Counter(REGISTRY, 'frames_encoded_total', 'Output frames of successfully rendered clips')
+QUEUE_DEPTH = Gauge(REGISTRY, 'pipeline_queue_depth', 'Items waiting in front of each pipeline stage')
+UPLOAD_STEP_SECONDS = Histogram(REGISTRY, 'upload_step_duration_seconds', 'Latency of each step of the TikTok upload flow')
+UPLOADS_UNCONFIRMED = Counter(REGISTRY, 'uploads_unconfirmed_total', 'Posts clicked without a confirmation from TikTok')
+
+
+def timed(stage):
+    """Decorator recording a function's latency and failures (an exception, None or False) under a stage name"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                STAGE_FAILURES.inc(stage=stage)
+                raise
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+            if result is None or result is False:
+                STAGE_FAILURES.inc(stage=stage)
+            return result
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+    
+    def log_message(self, *args):
+        pass
+    
+    def do_GET(self):
+        """Serve /metrics in Prometheus text format and /metrics.json as JSON"""
+        if self.path.startswith('/metrics.json'):
+            body = json.dumps(self.registry.to_dict()).encode()
+            content_type = 'application/json'
+        elif self.path.startswith('/metrics') or self.path == '/':
+            body = self.registry.render_prometheus().encode()
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """Serve the metrics endpoint from a background thread and return the server"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
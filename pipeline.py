@@ -0,0 +1,103 @@
+import time
+import queue
+import logging
+import threading
+
+from metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's input
+_STOP = object()
+
+
+class Stage:
+    def __init__(self, name, handler, workers=1, queue_size=1, on_error=None):
+        """Describe a pipeline stage; handler(item) returns an iterable of items for the next stage"""
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.on_error = on_error
+
+
+class Pipeline:
+    def __init__(self, stages):
+        """Chain stages with bounded queues; a full queue blocks the stage feeding it"""
+        self.stages = stages
+        self.stats = {}
+    
+    def run(self, items):
+        """Push items through every stage and wait until all of them are drained"""
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        self.stats = {
+            stage.name: {'processed': 0, 'failed': 0, 'busy_seconds': 0.0, 'max_queue_depth': 0}
+            for stage in self.stages
+        }
+        remaining = [stage.workers for stage in self.stages]
+        lock = threading.Lock()
+        threads = []
+        
+        def worker(index):
+            stage = self.stages[index]
+            stats = self.stats[stage.name]
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(self.stages) else None
+            
+            while True:
+                item = inbox.get()
+                if item is _STOP:
+                    break
+                
+                with lock:
+                    stats['max_queue_depth'] = max(stats['max_queue_depth'], inbox.qsize() + 1)
+                QUEUE_DEPTH.set(inbox.qsize(), stage=stage.name)
+                
+                start = time.time()
+                try:
+                    outputs = list(stage.handler(item) or [])
+                except Exception as e:
+                    logger.error(f"Error in {stage.name} stage: {str(e)}")
+                    with lock:
+                        stats['failed'] += 1
+                        stats['busy_seconds'] += time.time() - start
+                    if stage.on_error:
+                        try:
+                            stage.on_error(item, e)
+                        except Exception as cleanup_error:
+                            logger.error(f"Error cleaning up after {stage.name} stage: {str(cleanup_error)}")
+                    continue
+                
+                with lock:
+                    stats['processed'] += 1
+                    stats['busy_seconds'] += time.time() - start
+                
+                # Blocks while the next stage is backed up
+                if outbox is not None:
+                    for output in outputs:
+                        outbox.put(output)
+                        QUEUE_DEPTH.set(outbox.qsize(), stage=self.stages[index + 1].name)
+            
+            # The last worker of a stage to finish closes the next stage's input
+            with lock:
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            if last and outbox is not None:
+                for _ in range(self.stages[index + 1].workers):
+                    outbox.put(_STOP)
+        
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(target=worker, args=(index,), name=f"{stage.name}-{n}", daemon=True)
+                thread.start()
+                threads.append(thread)
+        
+        for item in items:
+            queues[0].put(item)
+        for _ in range(self.stages[0].workers):
+            queues[0].put(_STOP)
+        
+        for thread in threads:
+            thread.join()
+        
+        return self.stats
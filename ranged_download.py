@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import BYTES_TRANSFERRED
+
+logger = logging.getLogger(__name__)
+
+# Files smaller than this are fetched over a single connection
+MIN_RANGED_SIZE = 4 << 20
+
+
+class RangedDownloader:
+    def __init__(self, session, workers=4, chunk_size=8 << 20, retries=3):
+        """Download large files as byte ranges over several pooled connections, resuming after failures"""
+        self.session = session
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.last_stats = {}
+    
+    def _probe(self, url, headers):
+        """Return the total size of a resource if the server accepts range requests, else None"""
+        with self.session.get(url, headers=dict(headers, Range='bytes=0-0'), stream=True, timeout=30) as response:
+            response.raise_for_status()
+            content_range = response.headers.get('Content-Range', '')
+            if response.status_code == 206 and '/' in content_range:
+                total = content_range.rsplit('/', 1)[1]
+                if total.isdigit():
+                    return int(total)
+        return None
+    
+    def _load_parts(self, parts_path, size):
+        """Load the completed ranges of an earlier attempt (ignored if it was for a different size)"""
+        if not os.path.exists(parts_path):
+            return set()
+        try:
+            with open(parts_path, 'r') as f:
+                parts = json.load(f)
+            if parts.get('size') == size:
+                return {tuple(part) for part in parts.get('done', [])}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable download sidecar {parts_path}: {str(e)}")
+        return set()
+    
+    def _save_parts(self, parts_path, size, done):
+        """Persist the completed ranges atomically"""
+        temp_path = parts_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'size': size, 'done': sorted(done)}, f)
+        os.replace(temp_path, parts_path)
+    
+    def _fetch_range(self, url, headers, destination, start, end):
+        """Fetch bytes start..end (inclusive) into their place in the destination file"""
+        expected = end - start + 1
+        last_error = None
+        for attempt in range(self.retries):
+            try:
+                received = 0
+                with self.session.get(url, headers=dict(headers, Range=f'bytes={start}-{end}'), stream=True, timeout=60) as response:
+                    if response.status_code != 206:
+                        raise RuntimeError(f"Expected 206 for range {start}-{end}, got {response.status_code}")
+                    with open(destination, 'r+b') as f:
+                        f.seek(start)
+                        for chunk in response.iter_content(chunk_size=1 << 16):
+                            f.write(chunk)
+                            received += len(chunk)
+                if received != expected:
+                    raise RuntimeError(f"Range {start}-{end} returned {received} of {expected} bytes")
+                return expected
+            except Exception as e:
+                last_error = e
+                if attempt < self.retries - 1:
+                    time.sleep(2 ** attempt)
+        raise last_error
+    
+    def _fetch_whole(self, url, headers, destination):
+        """Stream a resource over one connection (server without range support or small file)"""
+        received = 0
+        with self.session.get(url, headers=headers, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            with open(destination, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
+                    received += len(chunk)
+        return received
+    
+    def download(self, url, destination, headers=None):
+        """Download url to destination and return the path; raises if the file is incomplete"""
+        headers = dict(headers or {})
+        start_time = time.time()
+        parts_path = destination + '.parts'
+        
+        size = self._probe(url, headers)
+        if size is None or size < MIN_RANGED_SIZE:
+            fetched = self._fetch_whole(url, headers, destination)
+            if size is not None and fetched != size:
+                raise RuntimeError(f"Downloaded {fetched} of {size} bytes for {destination}")
+            self._report(destination, fetched, fetched, 1, start_time)
+            return destination
+        
+        done = self._load_parts(parts_path, size)
+        if not done or not os.path.exists(destination) or os.path.getsize(destination) != size:
+            done = set()
+            # Preallocate so every range can be written in place
+            with open(destination, 'wb') as f:
+                f.truncate(size)
+        
+        ranges = [
+            (start, min(start + self.chunk_size, size) - 1)
+            for start in range(0, size, self.chunk_size)
+        ]
+        pending = [r for r in ranges if r not in done]
+        if len(pending) < len(ranges):
+            logger.info(f"Resuming {destination}: {len(ranges) - len(pending)}/{len(ranges)} ranges already done")
+        
+        lock = threading.Lock()
+        fetched = 0
+        
+        def fetch(byte_range):
+            nonlocal fetched
+            count = self._fetch_range(url, headers, destination, *byte_range)
+            with lock:
+                fetched += count
+                done.add(byte_range)
+                self._save_parts(parts_path, size, done)
+        
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(pending) or 1)) as executor:
+            # Surface the first failure; completed ranges stay recorded for the next attempt
+            for future in [executor.submit(fetch, byte_range) for byte_range in pending]:
+                future.result()
+        
+        if len(done) != len(ranges) or os.path.getsize(destination) != size:
+            raise RuntimeError(f"Incomplete download of {destination}: {len(done)}/{len(ranges)} ranges")
+        
+        os.remove(parts_path)
+        self._report(destination, size, fetched, min(self.workers, len(pending) or 1), start_time)
+        return destination
+    
+    def _report(self, destination, size, fetched, connections, start_time):
+        """Log and keep the throughput of the last download"""
+        elapsed = max(time.time() - start_time, 1e-6)
+        BYTES_TRANSFERRED.inc(fetched, kind='media')
+        self.last_stats = {
+            'bytes': size,
+            'fetched_bytes': fetched,
+            'seconds': elapsed,
+            'connections': connections,
+            'mbps': fetched * 8 / elapsed / 1e6
+        }
+        logger.info(
+            f"Downloaded {os.path.basename(destination)}: {size / 1e6:.1f} MB "
+            f"({fetched / 1e6:.1f} MB fetched) in {elapsed:.1f}s over {connections} connection(s), "
+            f"{self.last_stats['mbps']:.1f} Mbit/s"
+        )
@@ -0,0 +1,142 @@
+import os
+import time
+import logging
+import threading
+
+import numpy as np
+
+from ffmpeg_utils import decode_gray_frames, keyframe_times
+from search_utils import nearest_within
+
+logger = logging.getLogger(__name__)
+
+# Size of the frames compared for cut detection
+THUMB_WIDTH = 64
+THUMB_HEIGHT = 36
+
+# A cut must stand out this many times above the typical frame difference around it
+CUT_CONTRAST = 4.0
+
+# Seconds of context used for the typical frame difference
+CONTEXT_SECONDS = 5.0
+
+# Closer cuts than this (a flash, a fast montage) count once
+MIN_CUT_SPACING = 1.0
+
+
+def detect_cuts(differences, fps, threshold):
+    """Return the sample indices where a new shot starts, given the mean absolute difference to the previous sample"""
+    differences = np.asarray(differences, dtype=float)
+    if len(differences) < 2:
+        return np.array([], dtype=int)
+    
+    # Rolling median of the differences is the local level of motion a cut has to beat
+    radius = max(1, int(CONTEXT_SECONDS * fps / 2))
+    padded = np.pad(differences, radius, mode='edge')
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1)
+    local = np.median(windows, axis=1)
+    candidates = (differences > threshold) & (differences > CUT_CONTRAST * local)
+    
+    # Keep only the strongest candidate within MIN_CUT_SPACING
+    spacing = max(1, int(MIN_CUT_SPACING * fps / 2))
+    peaks = np.lib.stride_tricks.sliding_window_view(np.pad(differences, spacing, mode='constant'), 2 * spacing + 1).max(axis=1)
+    return np.flatnonzero(candidates & (differences >= peaks))
+
+
+class SceneIndex:
+    def __init__(self, cuts, keyframes, resolution):
+        """Sorted shot-cut and keyframe times of a video; a cut is known to within resolution seconds"""
+        self.cuts = np.sort(np.asarray(cuts, dtype=float))
+        self.keyframes = np.sort(np.asarray(keyframes, dtype=float))
+        self.resolution = resolution
+    
+    def snap(self, start_time, end_time, max_shift, max_length=None):
+        """Move a clip's start to a nearby cut (else back to a keyframe) and its end to just before a nearby cut"""
+        new_start = nearest_within(self.cuts, start_time, start_time - max_shift, start_time + max_shift)
+        if new_start is None:
+            # Starting on a keyframe lets the renderer seek without decoding a run-up
+            i = np.searchsorted(self.keyframes, start_time, side='right')
+            if i and self.keyframes[i - 1] >= start_time - max_shift:
+                new_start = float(self.keyframes[i - 1])
+            else:
+                new_start = start_time
+        new_start = max(0.0, new_start)
+        
+        limit = end_time + max_shift
+        if max_length is not None:
+            limit = min(limit, new_start + max_length + self.resolution)
+        cut = nearest_within(self.cuts, end_time, max(new_start + self.resolution, end_time - max_shift), limit)
+        # Stop one sample before the cut so the next shot never flashes at the end
+        new_end = end_time if cut is None else cut - self.resolution
+        if max_length is not None:
+            new_end = min(new_end, new_start + max_length)
+        return round(new_start, 3), round(new_end, 3)
+    
+    def save(self, path):
+        """Store the index as a small compressed NumPy archive"""
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez_compressed(
+            temp_path,
+            cuts=self.cuts.astype(np.float32),
+            keyframes=self.keyframes.astype(np.float32),
+            resolution=np.float32(self.resolution)
+        )
+        os.replace(temp_path, path)
+    
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save"""
+        with np.load(path) as data:
+            return cls(data['cuts'], data['keyframes'], float(data['resolution']))
+
+
+class SceneIndexStore:
+    def __init__(self, config):
+        """Build scene-cut indexes from low-resolution decodes and cache them by video ID"""
+        self.path = config.get('scene_index_path', './cache/scenes')
+        self.fps = config.get('scene_fps', 5)
+        self.threshold = config.get('scene_threshold', 0.12)
+        
+        os.makedirs(self.path, exist_ok=True)
+    
+    def _entry_path(self, video_id):
+        """Get the file path of a video's index"""
+        return os.path.join(self.path, f"{video_id}.npz")
+    
+    def get(self, video_id, video_path):
+        """Return the video's SceneIndex, building it on the first request, or None if the video can't be analyzed"""
+        entry_path = self._entry_path(video_id)
+        if os.path.exists(entry_path):
+            try:
+                return SceneIndex.load(entry_path)
+            except Exception as e:
+                logger.warning(f"Discarding unreadable scene index {entry_path}: {str(e)}")
+                os.remove(entry_path)
+        
+        try:
+            index = self.build(video_path)
+            index.save(entry_path)
+            return index
+        except Exception as e:
+            logger.warning(f"Could not build scene index for {video_id}: {str(e)}")
+            return None
+    
+    def build(self, video_path):
+        """Detect cuts from thumbnail differences and read the keyframe positions"""
+        start = time.perf_counter()
+        differences = []
+        previous = None
+        # Non-reference frames and the loop filter aren't needed to see a shot change at thumbnail size
+        input_args = ['-skip_frame', 'noref', '-skip_loop_filter', 'all']
+        for _, frame in decode_gray_frames(video_path, THUMB_WIDTH, THUMB_HEIGHT, self.fps, input_args):
+            frame = frame.astype(np.int16)
+            differences.append(0.0 if previous is None else np.abs(frame - previous).mean() / 255)
+            previous = frame
+        
+        cuts = detect_cuts(differences, self.fps, self.threshold) / self.fps
+        keyframes = keyframe_times(video_path)
+        logger.info(
+            f"Indexed {len(cuts)} cuts and {len(keyframes)} keyframes over {len(differences) / self.fps:.0f}s "
+            f"of {video_path} in {time.perf_counter() - start:.1f}s"
+        )
+        return SceneIndex(cuts, keyframes, 1 / self.fps)
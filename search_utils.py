@@ -0,0 +1,11 @@
+import numpy as np
+
+
+def nearest_within(points, target, lo, hi):
+    """Return the sorted point in [lo, hi] closest to target, or None"""
+    i = np.searchsorted(points, lo, side='left')
+    j = np.searchsorted(points, hi, side='right')
+    if i >= j:
+        return None
+    window = points[i:j]
+    return float(window[np.argmin(np.abs(window - target))])
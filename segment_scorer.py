@@ -0,0 +1,175 @@
+import re
+import numpy as np
+
+# Words that tend to open or carry a strong short-form moment (English and Indonesian)
+HOOK_WORDS = {
+    'secret', 'secrets', 'never', 'always', 'mistake', 'mistakes', 'truth', 'actually', 'why', 'how',
+    'imagine', 'crazy', 'insane', 'shocking', 'surprising', 'important', 'best', 'worst', 'biggest',
+    'nobody', 'everyone', 'stop', 'wrong', 'problem', 'money', 'free', 'hack', 'tip', 'tips', 'trick',
+    'rahasia', 'jangan', 'kenapa', 'bagaimana', 'ternyata', 'penting', 'salah', 'terbaik', 'terburuk',
+    'gila', 'bayangkan', 'semua', 'tidak', 'masalah', 'uang', 'gratis', 'cara', 'tips', 'trik'
+}
+
+# A gap between words longer than this counts as dead air
+PAUSE_SECONDS = 0.7
+
+# Hook words this close to the start of a window count extra
+HOOK_SECONDS = 5.0
+
+# Relative weight of each feature in the final score
+WEIGHTS = {
+    'speech_rate': 1.0,
+    'dead_air': -1.0,
+    'hooks': 1.0,
+    'opening_hook': 0.5,
+    'alignment': 0.75,
+    'loudness': 0.5
+}
+
+
+def _normalize_word(word):
+    """Lowercase a word and strip punctuation"""
+    return re.sub(r'[^\w]', '', word.lower())
+
+
+def loudness_profile(audio, sample_rate):
+    """Return the loudness of each second of PCM audio in dBFS"""
+    seconds = len(audio) // sample_rate
+    if seconds == 0:
+        return []
+    frames = audio[:seconds * sample_rate].reshape(seconds, sample_rate)
+    rms = np.sqrt(np.einsum('ij,ij->i', frames, frames) / sample_rate)
+    return np.round(20 * np.log10(rms + 1e-10), 1).tolist()
+
+
+def word_arrays(transcription):
+    """Flatten a transcription into word start/end arrays, normalized tokens and sentence-end flags"""
+    starts, ends, tokens, sentence_ends = [], [], [], []
+    for segment in transcription['segments']:
+        words = segment.get('words')
+        if not words:
+            # No word timestamps: spread the segment's words evenly over its duration
+            texts = segment['text'].split()
+            if not texts:
+                continue
+            edges = np.linspace(segment['start'], segment['end'], len(texts) + 1)
+            words = [{'word': text, 'start': edges[i], 'end': edges[i + 1]} for i, text in enumerate(texts)]
+        
+        for i, word in enumerate(words):
+            starts.append(word['start'])
+            ends.append(word['end'])
+            tokens.append(_normalize_word(word['word']))
+            # Whisper segments usually end on a sentence boundary as well
+            sentence_ends.append(bool(re.search(r'[.?!]["\')]*$', word['word'].strip())) or i == len(words) - 1)
+    
+    order = np.argsort(starts, kind='stable')
+    return (
+        np.array(starts, dtype=float)[order],
+        np.array(ends, dtype=float)[order],
+        [tokens[i] for i in order],
+        np.array(sentence_ends, dtype=bool)[order]
+    )
+
+
+def _zscore(values):
+    """Standardize a feature across windows (zero when it is constant)"""
+    std = values.std()
+    if std == 0:
+        return np.zeros_like(values)
+    return (values - values.mean()) / std
+
+
+def _nearest_distance(points, queries):
+    """Distance from each query to the nearest of the sorted points"""
+    index = np.searchsorted(points, queries)
+    before = points[np.clip(index - 1, 0, len(points) - 1)]
+    after = points[np.clip(index, 0, len(points) - 1)]
+    return np.minimum(np.abs(queries - before), np.abs(after - queries))
+
+
+class SegmentScorer:
+    def __init__(self, config):
+        """Score candidate clip windows locally from word timestamps and loudness"""
+        self.config = config
+    
+    def score_windows(self, transcription, video_duration, step=1.0):
+        """Score every clip_duration window (one per step seconds) and return (starts, ends, scores, features)"""
+        length = min(self.config['clip_duration'], video_duration)
+        starts = np.arange(0, max(video_duration - length, 0) + 1e-9, step)
+        ends = starts + length
+        
+        word_starts, word_ends, tokens, sentence_ends = word_arrays(transcription)
+        if len(word_starts) == 0:
+            zeros = np.zeros(len(starts))
+            return starts, ends, zeros, {}
+        
+        # Words are counted in a window by their start time
+        first = np.searchsorted(word_starts, starts, side='left')
+        last = np.searchsorted(word_starts, ends, side='left')
+        word_count = last - first
+        
+        # Cumulative sums turn every per-window total into two lookups
+        hooks = np.array([token in HOOK_WORDS for token in tokens], dtype=float)
+        hook_sums = np.concatenate([[0.0], np.cumsum(hooks)])
+        hook_count = hook_sums[last] - hook_sums[first]
+        opening = np.searchsorted(word_starts, starts + HOOK_SECONDS, side='left')
+        opening_hooks = hook_sums[opening] - hook_sums[first]
+        
+        # Dead air: long gaps between consecutive words, attributed to the gap's start
+        gaps = np.diff(word_starts, append=word_ends[-1]) - (word_ends - word_starts)
+        gaps = np.where(gaps > PAUSE_SECONDS, gaps, 0.0)
+        gap_sums = np.concatenate([[0.0], np.cumsum(gaps)])
+        leading = np.clip(word_starts[np.minimum(first, len(word_starts) - 1)] - starts, 0, length)
+        dead_air = np.where(word_count > 0, (gap_sums[last] - gap_sums[first] + leading) / length, 1.0)
+        
+        # Distance from each window edge to the nearest sentence start/end
+        sentence_starts = np.concatenate([[word_starts[0]], word_starts[1:][sentence_ends[:-1]]])
+        sentence_stops = word_ends[sentence_ends]
+        alignment = np.exp(-_nearest_distance(sentence_starts, starts)) + np.exp(-_nearest_distance(sentence_stops, ends))
+        
+        loudness = np.asarray(transcription.get('loudness') or [], dtype=float)
+        if len(loudness):
+            loud_sums = np.concatenate([[0.0], np.cumsum(loudness)])
+            lo = np.clip(starts.astype(int), 0, len(loudness))
+            hi = np.clip(np.ceil(ends).astype(int), 0, len(loudness))
+            mean_loudness = np.where(hi > lo, (loud_sums[hi] - loud_sums[lo]) / np.maximum(hi - lo, 1), loudness.min())
+        else:
+            mean_loudness = np.zeros(len(starts))
+        
+        features = {
+            'speech_rate': word_count / length,
+            'dead_air': dead_air,
+            'hooks': hook_count,
+            'opening_hook': opening_hooks,
+            'alignment': alignment,
+            'loudness': mean_loudness
+        }
+        scores = sum(WEIGHTS[name] * _zscore(values) for name, values in features.items())
+        return starts, ends, scores, features
+    
+    def top_segments(self, transcription, video_duration, count):
+        """Return the best-scoring non-overlapping windows as segments, best first"""
+        starts, ends, scores, features = self.score_windows(transcription, video_duration)
+        
+        chosen = []
+        for i in np.argsort(-scores, kind='stable'):
+            if len(chosen) >= count:
+                break
+            if any(starts[i] < ends[j] and ends[i] > starts[j] for j in chosen):
+                continue
+            chosen.append(i)
+        
+        segments = []
+        for i in chosen:
+            reasons = [
+                name.replace('_', ' ') for name in ('hooks', 'opening_hook', 'speech_rate', 'loudness')
+                if name in features and features[name][i] > features[name].mean()
+            ]
+            segments.append({
+                'start_time': float(starts[i]),
+                'end_time': float(ends[i]),
+                'score': round(float(scores[i]), 3),
+                'reason': 'Local score: ' + (', '.join(reasons) if reasons else 'best available window'),
+                'title': f'Clip {len(segments) + 1}'
+            })
+        return segments
@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import warnings
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from ffmpeg_utils import probe_media, decode_gray_frames
+
+logger = logging.getLogger(__name__)
+
+# Width of the frames the analysis runs on; height follows the source aspect ratio
+ANALYSIS_WIDTH = 320
+
+# Analyzed sources kept in memory
+ENTRY_CACHE_SIZE = 8
+
+# Frames considered by the median filter that drops one-off false detections
+MEDIAN_FRAMES = 5
+
+# Confidence of a frame whose target came from motion/edges rather than a face
+SALIENCY_WEIGHT = 0.3
+
+# Weight of the frame center, which the path drifts back to when nothing is detected for a while
+CENTER_PRIOR = 0.05
+
+
+class CropPath:
+    def __init__(self, fps, centers):
+        """Smoothed horizontal crop center over time, as fractions of the source width"""
+        self.fps = fps
+        self.centers = np.asarray(centers, dtype=float)
+    
+    def x_at(self, times, source_width, crop_width):
+        """Return the left edge of the crop at each source time, in source pixels"""
+        sample_times = np.arange(len(self.centers)) / self.fps
+        centers = np.interp(times, sample_times, self.centers)
+        x = np.round(centers * source_width - crop_width / 2)
+        # Even offsets keep the crop aligned to the chroma grid
+        x = np.clip(x, 0, source_width - crop_width).astype(int)
+        return x - x % 2
+
+
+def _face_target(faces, width, crop_fraction):
+    """Horizontal target of a frame's faces: the whole group when it fits in the crop, else the largest face"""
+    left = faces[:, 0].min()
+    right = (faces[:, 0] + faces[:, 2]).max()
+    if right - left <= crop_fraction * width:
+        return (left + right) / 2 / width
+    x, _, w, _ = faces[np.argmax(faces[:, 2] * faces[:, 3])]
+    return (x + w / 2) / width
+
+
+def _saliency_target(frame, previous):
+    """Horizontal target from where motion and edges concentrate, or None for a flat frame"""
+    edges = np.abs(np.diff(frame.astype(np.int16), axis=1)).sum(axis=0)
+    energy = np.concatenate([edges, edges[-1:]]).astype(float)
+    if previous is not None:
+        # Moving regions (a talking or gesturing speaker) count more than static texture
+        energy += 4 * np.abs(frame.astype(np.int16) - previous).sum(axis=0)
+    if energy.sum() < frame.size:
+        return None
+    return float(np.dot(np.arange(len(energy)) + 0.5, energy) / energy.sum() / len(energy))
+
+
+def smooth_path(targets, weights, fps, smoothing_seconds):
+    """Median-filter the per-frame targets, then take a confidence-weighted Gaussian average"""
+    targets = np.asarray(targets, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    
+    # Sliding-window median over the valid targets only
+    pad = MEDIAN_FRAMES // 2
+    padded = np.pad(np.where(weights > 0, targets, np.nan), pad, mode='edge')
+    windows = np.lib.stride_tricks.sliding_window_view(padded, MEDIAN_FRAMES)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        medians = np.nanmedian(windows, axis=1)
+    targets = np.where(np.isnan(medians), 0.5, medians)
+    
+    sigma = max(smoothing_seconds * fps, 1e-3)
+    radius = int(np.ceil(3 * sigma))
+    kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / sigma) ** 2)
+    weighted = np.convolve(np.pad(weights * targets, radius, mode='edge'), kernel, mode='valid')
+    total = np.convolve(np.pad(weights, radius, mode='edge'), kernel, mode='valid')
+    prior = CENTER_PRIOR * kernel.sum()
+    return (weighted + prior * 0.5) / (total + prior)
+
+
+def _load_face_detector():
+    """Return OpenCV's frontal face Haar cascade, or None when this OpenCV build ships without cascades"""
+    if not hasattr(cv2, 'CascadeClassifier'):
+        logger.warning("OpenCV has no CascadeClassifier, smart crop will follow motion and edges only")
+        return None
+    detector = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml'))
+    return None if detector.empty() else detector
+
+
+class SmartCropper:
+    def __init__(self, config):
+        """Track speakers on low-resolution frames to steer the 9:16 crop, caching the samples per source"""
+        self.path = config.get('smart_crop_cache_path', './cache/crops')
+        self.max_bytes = config.get('smart_crop_cache_max_mb', 50) * 1024 * 1024
+        self.fps = config.get('smart_crop_fps', 2)
+        self.smoothing = config.get('smart_crop_smoothing', 1.5)
+        self.detector = _load_face_detector()
+        self.lock = threading.Lock()
+        self._entries = OrderedDict()
+        
+        os.makedirs(self.path, exist_ok=True)
+    
+    def _cache_key(self, source_path, cache_id=None):
+        """Key a source by cache_id when given (a section in a scratch directory), else by its path, size and modification time"""
+        if cache_id is None:
+            stat = os.stat(source_path)
+            cache_id = f"{os.path.abspath(source_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        key = f"{cache_id}:{self.fps}:{ANALYSIS_WIDTH}"
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:32]
+    
+    def _load_entry(self, key):
+        """Return the analyzed samples of a source from memory or disk, or an empty entry"""
+        with self.lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        
+        entry = {'fps': self.fps, 'targets': [], 'weights': []}
+        entry_path = os.path.join(self.path, f"{key}.json")
+        if os.path.exists(entry_path):
+            try:
+                with open(entry_path, 'r') as f:
+                    entry = json.load(f)
+                # Touch the entry so eviction treats it as recently used
+                os.utime(entry_path)
+            except Exception as e:
+                logger.warning(f"Discarding unreadable crop entry {entry_path}: {str(e)}")
+        
+        with self.lock:
+            self._entries[key] = entry
+            while len(self._entries) > ENTRY_CACHE_SIZE:
+                self._entries.popitem(last=False)
+        return entry
+    
+    def _save_entry(self, key, entry):
+        """Write an entry atomically and evict the oldest entries over the size cap"""
+        entry_path = os.path.join(self.path, f"{key}.json")
+        temp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(temp_path, entry_path)
+        except Exception as e:
+            logger.warning(f"Could not store crop entry {entry_path}: {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self._evict(keep=entry_path)
+    
+    def _evict(self, keep=None):
+        """Remove the least recently used entries until the cache fits in its size cap"""
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.path):
+                if not name.endswith('.json'):
+                    continue
+                entry_path = os.path.join(self.path, name)
+                try:
+                    stat = os.stat(entry_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+            
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if entry_path == keep:
+                    continue
+                try:
+                    os.remove(entry_path)
+                    total -= size
+                except FileNotFoundError:
+                    continue
+    
+    def _missing_ranges(self, entry, windows):
+        """Sample index ranges the windows need (with room for the filters) that were never analyzed"""
+        margin = int(np.ceil(3 * self.smoothing * self.fps)) + MEDIAN_FRAMES
+        weights = entry['weights']
+        needed = set()
+        for start_time, end_time in windows:
+            lo = max(0, int(np.floor(start_time * self.fps)) - margin)
+            hi = int(np.ceil(end_time * self.fps)) + margin
+            needed.update(i for i in range(lo, hi) if i >= len(weights) or weights[i] is None)
+        
+        ranges = []
+        for i in sorted(needed):
+            if ranges and ranges[-1][1] == i:
+                ranges[-1][1] = i + 1
+            else:
+                ranges.append([i, i + 1])
+        return ranges
+    
+    def crop_path(self, source_path, crop_width_fraction, windows, cache_id=None):
+        """Return the CropPath of a source for the given (start, end) windows, or None if analysis fails"""
+        try:
+            key = self._cache_key(source_path, cache_id)
+            entry = self._load_entry(key)
+            missing = self._missing_ranges(entry, windows)
+            if missing:
+                self.analyze(source_path, crop_width_fraction, missing, entry)
+                self._save_entry(key, entry)
+            
+            # Samples outside the analyzed windows carry no weight and fall back to the frame center
+            targets = np.array([np.nan if target is None else target for target in entry['targets']], dtype=float)
+            weights = np.array([weight or 0.0 for weight in entry['weights']], dtype=float)
+            centers = smooth_path(targets, weights, self.fps, self.smoothing)
+            # Keep the center where a full-height crop still fits inside the frame
+            half = crop_width_fraction / 2
+            return CropPath(self.fps, np.clip(centers, half, 1 - half))
+        except Exception as e:
+            logger.warning(f"Smart crop analysis failed for {source_path}, using a centered crop: {str(e)}")
+            return None
+    
+    def analyze(self, source_path, crop_width_fraction, ranges, entry):
+        """Detect faces (else salient motion) on low-resolution frames of the sample ranges and store them in entry"""
+        start = time.perf_counter()
+        width, height = probe_media(source_path)['video_size']
+        analysis_height = max(2, int(round(ANALYSIS_WIDTH * height / width / 2)) * 2)
+        min_face = max(12, analysis_height // 12)
+        
+        targets, weights = entry['targets'], entry['weights']
+        end = max(hi for _, hi in ranges)
+        if len(weights) < end:
+            targets.extend([None] * (end - len(targets)))
+            weights.extend([None] * (end - len(weights)))
+        
+        frames = 0
+        faces_found = 0
+        for lo, hi in ranges:
+            # Reference frames are enough at a few samples per second, and skipping the loop filter makes decoding cheaper still
+            input_args = [
+                '-ss', f"{lo / self.fps:.3f}", '-t', f"{(hi - lo) / self.fps:.3f}",
+                '-skip_frame', 'noref', '-skip_loop_filter', 'all'
+            ]
+            previous = None
+            index = lo
+            for _, frame in decode_gray_frames(source_path, ANALYSIS_WIDTH, analysis_height, self.fps, input_args):
+                if index >= hi:
+                    break
+                faces = ()
+                if self.detector is not None:
+                    faces = self.detector.detectMultiScale(frame, scaleFactor=1.15, minNeighbors=5, minSize=(min_face, min_face))
+                if len(faces):
+                    targets[index] = _face_target(np.asarray(faces), ANALYSIS_WIDTH, crop_width_fraction)
+                    weights[index] = 1.0
+                    faces_found += 1
+                else:
+                    target = _saliency_target(frame, previous)
+                    targets[index] = target
+                    weights[index] = 0.0 if target is None else SALIENCY_WEIGHT
+                previous = frame.astype(np.int16)
+                index += 1
+            
+            # Past the end of the source: nothing to find, and nothing to retry later
+            for i in range(index, hi):
+                weights[i] = 0.0
+            frames += index - lo
+        
+        logger.info(
+            f"Smart crop analyzed {frames} frames of {source_path} in {time.perf_counter() - start:.1f}s "
+            f"(faces in {faces_found})"
+        )
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages in the order a video (and each of its clips) goes through them
+STAGES = ['discovered', 'downloaded', 'transcribed', 'segmented', 'rendered', 'uploaded']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT PRIMARY KEY,
+    channel TEXT,
+    url TEXT,
+    title TEXT,
+    published TEXT,
+    stage TEXT NOT NULL DEFAULT 'discovered',
+    video_path TEXT,
+    done INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS videos_pending ON videos (done, attempts);
+CREATE TABLE IF NOT EXISTS clips (
+    video_id TEXT NOT NULL,
+    clip_index INTEGER NOT NULL,
+    segment TEXT NOT NULL,
+    stage TEXT NOT NULL DEFAULT 'segmented',
+    clip_path TEXT,
+    updated_at REAL,
+    PRIMARY KEY (video_id, clip_index)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def stage_reached(stage, target):
+    """Check whether a stage is at or past the target stage"""
+    return STAGES.index(stage) >= STAGES.index(target)
+
+
+class StateStore:
+    def __init__(self, db_path='state.db'):
+        """Open (or create) the SQLite job and state store"""
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+    
+    def _execute(self, sql, params=()):
+        """Run one statement under the connection lock and return its rows"""
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+    
+    def import_processed_json(self, json_path='processed_videos.json'):
+        """Import the legacy processed_videos.json once"""
+        with self.lock:
+            if self.conn.execute("SELECT 1 FROM meta WHERE key = 'imported_processed_json'").fetchone():
+                return 0
+            
+            video_ids = []
+            if os.path.exists(json_path):
+                with open(json_path, 'r') as f:
+                    video_ids = json.load(f)
+            
+            now = time.time()
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO videos (video_id, stage, done, updated_at) VALUES (?, 'uploaded', 1, ?)",
+                [(video_id, now) for video_id in video_ids]
+            )
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('imported_processed_json', ?)", (str(now),))
+            self.conn.execute("COMMIT")
+        
+        if video_ids:
+            logger.info(f"Imported {len(video_ids)} processed videos from {json_path}")
+        return len(video_ids)
+    
+    def is_known(self, video_id):
+        """Check whether a video was already discovered (processed or still in progress)"""
+        return bool(self._execute("SELECT 1 FROM videos WHERE video_id = ?", (video_id,)))
+    
+    def add_video(self, video_info):
+        """Record a newly discovered video"""
+        published = video_info.get('published')
+        self._execute(
+            "INSERT OR IGNORE INTO videos (video_id, channel, url, title, published, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                video_info['video_id'], video_info.get('channel'), video_info.get('url'), video_info.get('title'),
+                published.isoformat() if hasattr(published, 'isoformat') else published, time.time()
+            )
+        )
+    
+    def start_attempt(self, video_id):
+        """Count an attempt to process a video"""
+        self._execute("UPDATE videos SET attempts = attempts + 1 WHERE video_id = ?", (video_id,))
+    
+    def set_stage(self, video_id, stage, video_path=None):
+        """Record that a video completed a stage, optionally with its source path"""
+        if video_path is None:
+            self._execute(
+                "UPDATE videos SET stage = ?, updated_at = ? WHERE video_id = ?",
+                (stage, time.time(), video_id)
+            )
+        else:
+            self._execute(
+                "UPDATE videos SET stage = ?, video_path = ?, updated_at = ? WHERE video_id = ?",
+                (stage, video_path, time.time(), video_id)
+            )
+    
+    def mark_done(self, video_id):
+        """Mark a video as processed so it is never picked up again"""
+        self._execute(
+            "INSERT INTO videos (video_id, done, updated_at) VALUES (?, 1, ?) "
+            "ON CONFLICT (video_id) DO UPDATE SET done = 1, updated_at = excluded.updated_at",
+            (video_id, time.time())
+        )
+    
+    def save_segments(self, video_id, segments):
+        """Store the chosen segments of a video as clips and move the video to the segmented stage"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM clips WHERE video_id = ?", (video_id,))
+            self.conn.executemany(
+                "INSERT INTO clips (video_id, clip_index, segment, updated_at) VALUES (?, ?, ?, ?)",
+                [(video_id, i, json.dumps(segment), now) for i, segment in enumerate(segments)]
+            )
+            self.conn.execute(
+                "UPDATE videos SET stage = 'segmented', updated_at = ? WHERE video_id = ?", (now, video_id)
+            )
+            self.conn.execute("COMMIT")
+    
+    def set_clip_stage(self, video_id, clip_index, stage, clip_path=None):
+        """Record that a clip completed a stage"""
+        self._execute(
+            "UPDATE clips SET stage = ?, clip_path = COALESCE(?, clip_path), updated_at = ? "
+            "WHERE video_id = ? AND clip_index = ?",
+            (stage, clip_path, time.time(), video_id, clip_index)
+        )
+    
+    def get_clips(self, video_id):
+        """Return the clips of a video ordered by index"""
+        rows = self._execute(
+            "SELECT clip_index, segment, stage, clip_path FROM clips WHERE video_id = ? ORDER BY clip_index",
+            (video_id,)
+        )
+        return [
+            {'clip_index': row['clip_index'], 'segment': json.loads(row['segment']),
+             'stage': row['stage'], 'clip_path': row['clip_path']}
+            for row in rows
+        ]
+    
+    def pending_videos(self, max_attempts):
+        """Return unfinished videos that can still be retried, with their last completed stage"""
+        rows = self._execute(
+            "SELECT * FROM videos WHERE done = 0 AND attempts < ? ORDER BY updated_at", (max_attempts,)
+        )
+        return [
+            {
+                'channel': row['channel'],
+                'video_id': row['video_id'],
+                'url': row['url'],
+                'title': row['title'],
+                'published': row['published'],
+                'stage': row['stage'],
+                'video_path': row['video_path']
+            }
+            for row in rows
+        ]
@@ -0,0 +1,92 @@
+import os
+import re
+import sys
+import threading
+import functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+
+# The modules live flat at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+    
+    def do_GET(self):
+        """Serve a fixture file with an ETag validator and single byte-range support, recording the request"""
+        server = self.server
+        server.requests.append({'path': self.path, 'headers': dict(self.headers)})
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        
+        stat = os.stat(path)
+        etag = f'"{stat.st_size}-{stat.st_mtime_ns}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        
+        size = stat.st_size
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', '')) if server.ranges else None
+        start, end = (int(match.group(1)), min(int(match.group(2) or size - 1), size - 1)) if match else (0, size - 1)
+        if match and server.fail_from is not None and start >= server.fail_from:
+            self.send_error(500)
+            return
+        
+        self.send_response(206 if match else 200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('ETag', etag)
+        if server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if match:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = f.read(min(remaining, 1 << 16))
+                if not data:
+                    break
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                remaining -= len(data)
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    """Local HTTP server over tmp_path/www; toggle ranges or fail ranges from a byte offset on the returned server"""
+    root = tmp_path / 'www'
+    root.mkdir()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(FixtureHandler, directory=str(root)))
+    server.root = root
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    server.requests = []
+    server.ranges = True
+    server.fail_from = None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def downloader(tmp_path, monkeypatch):
+    """VideoDownloader whose state database and feed cache live in tmp_path"""
+    from video_downloader import VideoDownloader
+    
+    monkeypatch.chdir(tmp_path)
+    return VideoDownloader({
+        'channels': {},
+        'state_db': str(tmp_path / 'state.db'),
+        'download_workers': 4,
+        'download_chunk_mb': 1
+    })
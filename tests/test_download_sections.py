@@ -0,0 +1,72 @@
+import pytest
+
+from ffmpeg_utils import run_ffmpeg, probe_media, decode_gray_frames
+
+DURATION = 20
+
+
+@pytest.fixture(scope='module')
+def streams_dir(tmp_path_factory):
+    """Separate video-only and audio-only fixture files; the picture brightness is 10x the source time in seconds"""
+    directory = tmp_path_factory.mktemp('streams')
+    run_ffmpeg([
+        '-f', 'lavfi', '-i', f"color=black:size=160x90:rate=10:duration={DURATION},format=gray,geq=lum='10*floor(T)'",
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '10', '-pix_fmt', 'yuv420p', str(directory / 'video.mp4')
+    ])
+    run_ffmpeg([
+        '-f', 'lavfi', '-i', f"sine=frequency=440:duration={DURATION}",
+        '-c:a', 'aac', str(directory / 'audio.m4a')
+    ])
+    return directory
+
+
+@pytest.fixture
+def streams(http_server, streams_dir):
+    """Resolved-stream dict pointing at the fixture server"""
+    for name in ('video.mp4', 'audio.m4a'):
+        (http_server.root / name).write_bytes((streams_dir / name).read_bytes())
+    return {
+        'video_id': 'fixture',
+        'video_url': f"{http_server.url}/video.mp4",
+        'audio_url': f"{http_server.url}/audio.m4a",
+        'http_headers': {'User-Agent': 'fixture'}
+    }
+
+
+def brightness_at(path, seconds):
+    """Mean brightness of the frame shown at a time of a file"""
+    for time, frame in decode_gray_frames(path, 16, 9, 10):
+        if time >= seconds:
+            return float(frame.mean())
+    raise AssertionError(f"{path} ends before {seconds}s")
+
+
+def test_sections_cover_segments_with_matching_offsets(downloader, streams, tmp_path):
+    segments = [
+        {'start_time': 5, 'end_time': 7, 'title': 'a'},
+        {'start_time': 6, 'end_time': 8, 'title': 'b'},
+        {'start_time': 15, 'end_time': 17, 'title': 'c'}
+    ]
+    located, section_paths = downloader.download_sections(streams, segments, str(tmp_path), margin=1)
+    
+    # Overlapping padded windows share one section
+    assert len(section_paths) == 2
+    assert [segment['source_offset'] for segment in located] == [4, 4, 14]
+    assert located[0]['source_path'] == located[1]['source_path'] == section_paths[0]
+    assert located[2]['source_path'] == section_paths[1]
+    
+    for segment in located:
+        info = probe_media(segment['source_path'])
+        assert info['video_found'] and info['audio_found']
+        assert info['duration'] >= segment['end_time'] - segment['source_offset'] - 0.1
+        # Section time t shows source time source_offset + t
+        local_start = segment['start_time'] - segment['source_offset']
+        assert brightness_at(segment['source_path'], local_start + 0.05) == pytest.approx(10 * segment['start_time'], abs=3)
+
+
+def test_sections_send_the_stream_headers(downloader, streams, http_server, tmp_path):
+    downloader.download_sections(streams, [{'start_time': 10, 'end_time': 11, 'title': 'a'}], str(tmp_path), margin=0.5)
+    
+    media_requests = [request for request in http_server.requests if request['path'] in ('/video.mp4', '/audio.m4a')]
+    assert {request['path'] for request in media_requests} == {'/video.mp4', '/audio.m4a'}
+    assert all(request['headers'].get('User-Agent') == 'fixture' for request in media_requests)
@@ -0,0 +1,81 @@
+import json
+from datetime import datetime, timezone
+
+FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom">
+  <title>Fixture channel</title>
+  {entries}
+</feed>
+"""
+
+ENTRY = """<entry>
+    <id>yt:video:{video_id}</id>
+    <yt:videoId>{video_id}</yt:videoId>
+    <title>{title}</title>
+    <published>{published}</published>
+  </entry>"""
+
+
+def write_feed(server, name, videos):
+    """Write an Atom feed fixture in the YouTube format and return its URL"""
+    entries = ''.join(
+        ENTRY.format(video_id=video_id, title=title, published=published)
+        for video_id, title, published in videos
+    )
+    (server.root / name).write_text(FEED.format(entries=entries))
+    return f"{server.url}/{name}"
+
+
+def test_conditional_get_reuses_entries_on_304(http_server, downloader):
+    url = write_feed(http_server, 'feed.xml', [('abc123', 'First video', '2024-05-01T10:00:00+00:00')])
+    
+    first = downloader.fetch_feed('fixture', url)
+    assert [entry['video_id'] for entry in first] == ['abc123']
+    assert downloader.feed_stats['fixture']['status'] == 200
+    assert 'If-None-Match' not in http_server.requests[0]['headers']
+    
+    second = downloader.fetch_feed('fixture', url)
+    assert second == first
+    assert downloader.feed_stats['fixture']['status'] == 304
+    assert downloader.feed_stats['fixture']['bytes'] == 0
+    assert http_server.requests[1]['headers']['If-None-Match'] == downloader.feed_cache[url]['etag']
+
+
+def test_changed_feed_is_parsed_again(http_server, downloader):
+    url = write_feed(http_server, 'feed.xml', [('abc123', 'First video', '2024-05-01T10:00:00+00:00')])
+    downloader.fetch_feed('fixture', url)
+    
+    write_feed(http_server, 'feed.xml', [
+        ('def456', 'Second video', '2024-05-02T10:00:00+00:00'),
+        ('abc123', 'First video', '2024-05-01T10:00:00+00:00')
+    ])
+    entries = downloader.fetch_feed('fixture', url)
+    assert downloader.feed_stats['fixture']['status'] == 200
+    assert [entry['video_id'] for entry in entries] == ['def456', 'abc123']
+
+
+def test_validators_survive_a_restart(http_server, downloader, tmp_path):
+    from video_downloader import VideoDownloader, FEED_CACHE_FILE
+    
+    url = write_feed(http_server, 'feed.xml', [('abc123', 'First video', '2024-05-01T10:00:00+00:00')])
+    downloader.config['channels'] = {'fixture': {'rss_url': url}}
+    downloader.check_new_videos()
+    with open(tmp_path / FEED_CACHE_FILE) as f:
+        assert json.load(f)[url]['entries'][0]['video_id'] == 'abc123'
+    
+    restarted = VideoDownloader(downloader.config)
+    assert [entry['video_id'] for entry in restarted.fetch_feed('fixture', url)] == ['abc123']
+    assert restarted.feed_stats['fixture']['status'] == 304
+
+
+def test_check_new_videos_polls_every_channel(http_server, downloader):
+    now = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+    downloader.config['channels'] = {
+        f'channel{i}': {'rss_url': write_feed(http_server, f'feed{i}.xml', [(f'new{i}', f'Video {i}', now)])}
+        for i in range(5)
+    }
+    downloader.config['channels']['broken'] = {'rss_url': f"{http_server.url}/missing.xml"}
+    
+    videos = downloader.check_new_videos()
+    assert sorted(video['video_id'] for video in videos) == [f'new{i}' for i in range(5)]
+    assert downloader.feed_stats['broken']['status'] == 'error'
@@ -0,0 +1,87 @@
+import os
+import json
+
+import pytest
+import requests
+
+from ranged_download import RangedDownloader, MIN_RANGED_SIZE
+
+CHUNK = 1 << 20
+
+
+@pytest.fixture
+def media(http_server):
+    """A file above the ranged-download threshold, served by the fixture server"""
+    data = os.urandom(MIN_RANGED_SIZE + 3 * CHUNK + 12345)
+    (http_server.root / 'media.bin').write_bytes(data)
+    return f"{http_server.url}/media.bin", data
+
+
+def range_starts(server):
+    """Start offsets of the data range requests the server received (the 0-0 probe left out)"""
+    return sorted(
+        int(request['headers']['Range'].split('=')[1].split('-')[0])
+        for request in server.requests
+        if request['headers'].get('Range') not in (None, 'bytes=0-0')
+    )
+
+
+def test_parallel_ranges_reassemble_the_file(http_server, media, tmp_path):
+    url, data = media
+    downloader = RangedDownloader(requests.Session(), workers=4, chunk_size=CHUNK)
+    destination = str(tmp_path / 'media.bin')
+    
+    assert downloader.download(url, destination) == destination
+    with open(destination, 'rb') as f:
+        assert f.read() == data
+    assert not os.path.exists(destination + '.parts')
+    assert range_starts(http_server) == list(range(0, len(data), CHUNK))
+    assert downloader.last_stats['connections'] == 4
+
+
+def test_resume_fetches_only_missing_ranges(http_server, media, tmp_path):
+    url, data = media
+    downloader = RangedDownloader(requests.Session(), workers=1, chunk_size=CHUNK, retries=1)
+    destination = str(tmp_path / 'media.bin')
+    
+    # Every range from the third one on fails, so the first attempt stops part way
+    http_server.fail_from = 2 * CHUNK
+    with pytest.raises(Exception):
+        downloader.download(url, destination)
+    with open(destination + '.parts') as f:
+        parts = json.load(f)
+    assert parts['size'] == len(data)
+    assert sorted(start for start, _ in parts['done']) == [0, CHUNK]
+    
+    http_server.fail_from = None
+    http_server.requests.clear()
+    downloader.download(url, destination)
+    with open(destination, 'rb') as f:
+        assert f.read() == data
+    assert not os.path.exists(destination + '.parts')
+    assert range_starts(http_server) == list(range(2 * CHUNK, len(data), CHUNK))
+    assert downloader.last_stats['fetched_bytes'] == len(data) - 2 * CHUNK
+
+
+def test_sidecar_for_another_size_is_ignored(http_server, media, tmp_path):
+    url, data = media
+    destination = str(tmp_path / 'media.bin')
+    with open(destination + '.parts', 'w') as f:
+        json.dump({'size': len(data) + 1, 'done': [[0, CHUNK - 1]]}, f)
+    
+    RangedDownloader(requests.Session(), workers=2, chunk_size=CHUNK).download(url, destination)
+    with open(destination, 'rb') as f:
+        assert f.read() == data
+    assert range_starts(http_server)[0] == 0
+
+
+def test_server_without_ranges_streams_the_whole_file(http_server, media, tmp_path):
+    url, data = media
+    http_server.ranges = False
+    downloader = RangedDownloader(requests.Session(), workers=4, chunk_size=CHUNK)
+    destination = str(tmp_path / 'media.bin')
+    
+    downloader.download(url, destination)
+    with open(destination, 'rb') as f:
+        assert f.read() == data
+    assert downloader.last_stats['connections'] == 1
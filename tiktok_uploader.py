@@ -1,20 +1,53 @@
 import os
 import time
 import logging
+from contextlib import contextmanager
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import TimeoutException
+
+from driver_pool import DriverPool
+from metrics import timed, UPLOAD_STEP_SECONDS, UPLOADS_UNCONFIRMED
 
 logger = logging.getLogger(__name__)
 
+# Elements that only appear for a logged-in user
+LOGGED_IN_INDICATORS = [
+    (By.XPATH, "//div[contains(@class, 'avatar')]"),
+    (By.XPATH, "//a[contains(@href, '/upload')]"),
+    (By.XPATH, "//*[contains(text(), 'Upload')]"),
+    (By.XPATH, "//div[contains(@class, 'user-info')]")
+]
+
+# Messages or pages shown once TikTok accepted a post
+UPLOAD_SUCCESS_INDICATORS = [
+    (By.XPATH, "//*[contains(text(), 'Your video has been uploaded')]"),
+    (By.XPATH, "//*[contains(text(), 'Your video is being uploaded')]"),
+    (By.XPATH, "//*[contains(text(), 'Video published')]"),
+    (By.XPATH, "//*[contains(text(), 'Manage your posts')]")
+]
+
 class TikTokUploader:
     def __init__(self, config):
         """Initialize TikTok uploader with configuration"""
         self.config = config
+        
+        # Each parallel session needs its own Chrome profile; the first keeps the original directory
+        sessions = max(1, self.config.get('tiktok_sessions', 1))
+        profile_dirs = [os.path.join(os.getcwd(), "chrome_user_data")] + [
+            os.path.join(os.getcwd(), f"chrome_user_data_{i}") for i in range(1, sessions)
+        ]
+        self.driver_pool = DriverPool(
+            self.setup_chrome_driver,
+            self.ensure_logged_in,
+            profile_dirs,
+            max_uploads=self.config.get('driver_max_uploads', 20)
+        )
     
-    def setup_chrome_driver(self):
+    def setup_chrome_driver(self, user_data_dir=None):
         """Setup Chrome driver with persistent session"""
         chrome_options = Options()
         chrome_options.add_argument("--no-sandbox")
@@ -24,7 +57,8 @@ class TikTokUploader:
         chrome_options.add_experimental_option('useAutomationExtension', False)
         
         # Use persistent user data directory to maintain login session
-        user_data_dir = os.path.join(os.getcwd(), "chrome_user_data")
+        if user_data_dir is None:
+            user_data_dir = os.path.join(os.getcwd(), "chrome_user_data")
         chrome_options.add_argument(f"--user-data-dir={user_data_dir}")
         
         # Optional: uncomment for headless mode (not recommended for first-time login)
@@ -35,6 +69,50 @@ class TikTokUploader:
         
         return driver
 
+    @contextmanager
+    def _timed_step(self, name, timings):
+        """Record how long one step of the upload flow took, for the log line and the step histogram"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            timings[name] = elapsed
+            UPLOAD_STEP_SECONDS.observe(elapsed, step=name)
+    
+    def _wait_for_page_load(self, driver, timeout=30):
+        """Wait until the current document finished loading"""
+        WebDriverWait(driver, timeout).until(
+            lambda d: d.execute_script("return document.readyState") == "complete"
+        )
+    
+    def _wait_for_any(self, driver, locators, timeout, clickable=False):
+        """Wait until any of the locators matches a visible (or clickable) element and return it, or None"""
+        def find(d):
+            for by, selector in locators:
+                for element in d.find_elements(by, selector):
+                    try:
+                        if element.is_displayed() and (not clickable or element.is_enabled()):
+                            return element
+                    except Exception:
+                        continue
+            return False
+        
+        try:
+            return WebDriverWait(driver, timeout).until(find)
+        except TimeoutException:
+            return None
+    
+    def _is_enabled_button(self, element):
+        """Check that a button is enabled, including TikTok's aria/data disabled flags"""
+        if not element.is_displayed() or not element.is_enabled():
+            return False
+        for attribute in ('disabled', 'aria-disabled', 'data-disabled'):
+            value = element.get_attribute(attribute)
+            if value is not None and value != 'false':
+                return False
+        return True
+    
     def login_tiktok_with_google(self, driver):
         """Login to TikTok using Google OAuth"""
         try:
@@ -42,33 +120,32 @@ class TikTokUploader:
             
             # Navigate to TikTok login page
             driver.get("https://www.tiktok.com/login")
-            time.sleep(3)
+            self._wait_for_page_load(driver)
             
             # Look for Google login button
             try:
-                # Try different possible selectors for Google login
+                # Try different possible selectors for Google login, all at once
                 google_login_selectors = [
-                    "//div[contains(text(), 'Continue with Google')]",
-                    "//button[contains(text(), 'Continue with Google')]",
-                    "//div[contains(@class, 'google')]//parent::div",
-                    "//*[contains(text(), 'Google')]//ancestor::div[contains(@class, 'login')]"
+                    (By.XPATH, "//div[contains(text(), 'Continue with Google')]"),
+                    (By.XPATH, "//button[contains(text(), 'Continue with Google')]"),
+                    (By.XPATH, "//div[contains(@class, 'google')]//parent::div"),
+                    (By.XPATH, "//*[contains(text(), 'Google')]//ancestor::div[contains(@class, 'login')]")
                 ]
                 
-                google_button = None
-                for selector in google_login_selectors:
-                    try:
-                        google_button = wait.until(EC.element_to_be_clickable((By.XPATH, selector)))
-                        break
-                    except:
-                        continue
+                google_button = self._wait_for_any(driver, google_login_selectors, 30, clickable=True)
                 
                 if not google_button:
                     logger.error("Could not find Google login button")
                     return False
                 
-                # Click Google login button
+                # Click Google login button and wait for the OAuth popup or page
+                windows_before = len(driver.window_handles)
                 google_button.click()
-                time.sleep(3)
+                try:
+                    wait.until(lambda d: len(d.window_handles) > windows_before or "accounts.google.com" in d.current_url)
+                except TimeoutException:
+                    # No OAuth window, e.g. Google account already linked; continue with the checks below
+                    pass
                 
                 # Handle Google OAuth flow
                 # Switch to Google login window if it opens in a new tab
@@ -87,7 +164,6 @@ class TikTokUploader:
                     # Click Next
                     next_button = driver.find_element(By.ID, "identifierNext")
                     next_button.click()
-                    time.sleep(3)
                     
                     # Enter password
                     password_input = wait.until(EC.element_to_be_clickable((By.NAME, "password")))
@@ -96,7 +172,6 @@ class TikTokUploader:
                     # Click Next
                     password_next = driver.find_element(By.ID, "passwordNext")
                     password_next.click()
-                    time.sleep(5)
                     
                 except:
                     # Might already be logged in to Google, continue
@@ -109,33 +184,14 @@ class TikTokUploader:
                 if len(driver.window_handles) > 1:
                     driver.switch_to.window(driver.window_handles[0])
                 
-                # Verify login success
-                time.sleep(5)
+                # Verify login success by waiting for profile or upload elements
+                if self._wait_for_any(driver, LOGGED_IN_INDICATORS, 30):
+                    logger.info("Successfully logged in to TikTok with Google")
+                    return True
                 
-                # Check if we're logged in by looking for profile or upload elements
-                try:
-                    # Look for elements that indicate successful login
-                    logged_in_indicators = [
-                        "//div[contains(@class, 'avatar')]",
-                        "//a[contains(@href, '/upload')]",
-                        "//*[contains(text(), 'Upload')]"
-                    ]
-                    
-                    for indicator in logged_in_indicators:
-                        try:
-                            driver.find_element(By.XPATH, indicator)
-                            logger.info("Successfully logged in to TikTok with Google")
-                            return True
-                        except:
-                            continue
-                    
-                    # If no indicators found, assume login failed
-                    logger.warning("Login may have failed - no login indicators found")
-                    return False
-                    
-                except Exception as e:
-                    logger.error(f"Error verifying login: {str(e)}")
-                    return False
+                # If no indicators found, assume login failed
+                logger.warning("Login may have failed - no login indicators found")
+                return False
                     
             except Exception as e:
                 logger.error(f"Error during Google login: {str(e)}")
@@ -150,23 +206,12 @@ class TikTokUploader:
         try:
             # Navigate to TikTok homepage
             driver.get("https://www.tiktok.com")
-            time.sleep(3)
+            self._wait_for_page_load(driver)
             
-            # Check for login indicators
-            logged_in_indicators = [
-                "//div[contains(@class, 'avatar')]",
-                "//a[contains(@href, '/upload')]",
-                "//*[contains(text(), 'Upload')]",
-                "//div[contains(@class, 'user-info')]"
-            ]
-            
-            for indicator in logged_in_indicators:
-                try:
-                    driver.find_element(By.XPATH, indicator)
-                    logger.info("Already logged in to TikTok")
-                    return True
-                except:
-                    continue
+            # Check for login indicators as soon as the page renders them
+            if self._wait_for_any(driver, LOGGED_IN_INDICATORS, self.config.get('tiktok_login_check_timeout', 10)):
+                logger.info("Already logged in to TikTok")
+                return True
             
             logger.info("Not logged in to TikTok")
             return False
@@ -175,41 +220,66 @@ class TikTokUploader:
             logger.error(f"Error checking login status: {str(e)}")
             return False
 
+    def ensure_logged_in(self, driver):
+        """Make sure a freshly started browser is logged in to TikTok"""
+        # Check if already logged in
+        if self.check_login_status(driver):
+            return True
+        
+        # Attempt login with Google
+        if not self.login_tiktok_with_google(driver):
+            logger.error("Failed to login to TikTok")
+            return False
+        return True
+    
+    def close(self):
+        """Close all pooled browser sessions"""
+        self.driver_pool.close()
+    
+    @timed('upload')
     def upload_to_tiktok(self, video_path, metadata):
         """Upload video to TikTok using Selenium with Google OAuth"""
-        driver = None
         try:
-            # Setup Chrome driver
-            driver = self.setup_chrome_driver()
-            
-            # Check if already logged in
-            if not self.check_login_status(driver):
-                # Attempt login with Google
-                if not self.login_tiktok_with_google(driver):
-                    logger.error("Failed to login to TikTok")
-                    return False
-            
+            # Borrow a warm, logged-in browser from the pool
+            with self.driver_pool.session() as session:
+                success = self._upload_with_driver(session.driver, video_path, metadata)
+                if not success:
+                    # Recycle the browser in case the page was left in a bad state
+                    session.failed = True
+                return success
+                
+        except Exception as e:
+            logger.error(f"Error uploading to TikTok: {str(e)}")
+            return False
+    
+    def _upload_with_driver(self, driver, video_path, metadata):
+        """Run the upload flow on an already logged-in browser"""
+        timings = {}
+        upload_timeout = self.config.get('tiktok_upload_timeout', 300)
+        start = time.time()
+        try:
             # Navigate to upload page
-            driver.get("https://www.tiktok.com/upload")
-            wait = WebDriverWait(driver, 30)
-            time.sleep(5)
+            with self._timed_step('open_upload_page', timings):
+                driver.get("https://www.tiktok.com/upload")
+                self._wait_for_page_load(driver)
             
             # Upload video file
             try:
                 # Look for file input
                 file_input_selectors = [
-                    "input[type='file']",
-                    "input[accept*='video']",
-                    ".upload-btn input[type='file']"
+                    (By.CSS_SELECTOR, "input[type='file']"),
+                    (By.CSS_SELECTOR, "input[accept*='video']"),
+                    (By.CSS_SELECTOR, ".upload-btn input[type='file']")
                 ]
                 
-                file_input = None
-                for selector in file_input_selectors:
+                # File inputs are usually hidden, so wait for presence rather than visibility
+                with self._timed_step('find_file_input', timings):
                     try:
-                        file_input = driver.find_element(By.CSS_SELECTOR, selector)
-                        break
-                    except:
-                        continue
+                        file_input = WebDriverWait(driver, 30).until(
+                            lambda d: next((e for by, sel in file_input_selectors for e in d.find_elements(by, sel)), False)
+                        )
+                    except TimeoutException:
+                        file_input = None
                 
                 if not file_input:
                     logger.error("Could not find file input element")
@@ -219,24 +289,16 @@ class TikTokUploader:
                 file_input.send_keys(os.path.abspath(video_path))
                 logger.info("Video file uploaded, waiting for processing...")
                 
-                # Wait for video to upload and process
-                time.sleep(15)
-                
-                # Add caption/description
+                # Add caption/description as soon as the editor is ready
                 caption_selectors = [
-                    "[data-contents='true']",
-                    "div[contenteditable='true']",
-                    ".notranslate[contenteditable='true']",
-                    "div[role='textbox']"
+                    (By.CSS_SELECTOR, "[data-contents='true']"),
+                    (By.CSS_SELECTOR, "div[contenteditable='true']"),
+                    (By.CSS_SELECTOR, ".notranslate[contenteditable='true']"),
+                    (By.CSS_SELECTOR, "div[role='textbox']")
                 ]
                 
-                caption_field = None
-                for selector in caption_selectors:
-                    try:
-                        caption_field = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, selector)))
-                        break
-                    except:
-                        continue
+                with self._timed_step('caption_editor_ready', timings):
+                    caption_field = self._wait_for_any(driver, caption_selectors, upload_timeout, clickable=True)
                 
                 if caption_field:
                     caption_text = f"{metadata['description']} {' '.join(metadata['hashtags'])}"
@@ -246,37 +308,52 @@ class TikTokUploader:
                 else:
                     logger.warning("Could not find caption field")
                 
-                # Look for and click Post button
-                time.sleep(3)
+                # The Post button only becomes enabled once the upload finished processing
                 post_button_selectors = [
-                    "//div[contains(text(), 'Post')]",
-                    "//button[contains(text(), 'Post')]",
-                    "//div[contains(text(), 'Publish')]",
-                    "//button[contains(text(), 'Publish')]"
+                    (By.XPATH, "//button[contains(., 'Post')]"),
+                    (By.XPATH, "//div[contains(text(), 'Post')]"),
+                    (By.XPATH, "//button[contains(., 'Publish')]"),
+                    (By.XPATH, "//div[contains(text(), 'Publish')]")
                 ]
                 
-                post_button = None
-                for selector in post_button_selectors:
+                def find_enabled_post_button(d):
+                    for by, selector in post_button_selectors:
+                        for element in d.find_elements(by, selector):
+                            try:
+                                if self._is_enabled_button(element):
+                                    return element
+                            except Exception:
+                                continue
+                    return False
+                
+                with self._timed_step('upload_processed', timings):
                     try:
-                        post_button = driver.find_element(By.XPATH, selector)
-                        if post_button.is_enabled():
-                            break
-                    except:
-                        continue
+                        post_button = WebDriverWait(driver, upload_timeout).until(find_enabled_post_button)
+                    except TimeoutException:
+                        post_button = None
                 
-                if post_button and post_button.is_enabled():
-                    post_button.click()
-                    logger.info("Post button clicked")
-                    
-                    # Wait for confirmation
-                    time.sleep(10)
-                    
-                    logger.info(f"Successfully uploaded video: {metadata['title']}")
-                    return True
-                else:
+                if not post_button:
                     logger.error("Could not find or click Post button")
                     return False
                 
+                post_button.click()
+                logger.info("Post button clicked")
+                
+                # Wait for confirmation
+                with self._timed_step('confirmation', timings):
+                    confirmed = self._wait_for_any(
+                        driver, UPLOAD_SUCCESS_INDICATORS, self.config.get('tiktok_confirm_timeout', 60)
+                    )
+                
+                if not confirmed:
+                    # The post may or may not have gone through; don't count it as uploaded
+                    UPLOADS_UNCONFIRMED.inc()
+                    logger.warning(f"Post was clicked but no upload confirmation was shown for: {metadata['title']}")
+                    return False
+                
+                logger.info(f"Successfully uploaded video: {metadata['title']}")
+                return True
+                
             except Exception as e:
                 logger.error(f"Error during upload process: {str(e)}")
                 return False
@@ -285,5 +362,5 @@ class TikTokUploader:
             logger.error(f"Error uploading to TikTok: {str(e)}")
             return False
         finally:
-            if driver:
-                driver.quit() 
\ No newline at end of file
+            steps = ', '.join(f"{name} {seconds:.1f}s" for name, seconds in timings.items())
+            logger.info(f"Upload took {time.time() - start:.1f}s ({steps})")
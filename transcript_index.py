@@ -0,0 +1,59 @@
+import numpy as np
+
+from search_utils import nearest_within
+from segment_scorer import word_arrays
+
+
+class TranscriptIndex:
+    def __init__(self, transcription):
+        """Index transcript segments and words by time for binary-search overlap and boundary queries"""
+        segments = transcription['segments']
+        order = np.argsort([segment['start'] for segment in segments], kind='stable')
+        self.segments = [segments[i] for i in order]
+        self.starts = np.array([segment['start'] for segment in self.segments], dtype=float)
+        self.ends = np.array([segment['end'] for segment in self.segments], dtype=float)
+        # Running maximum of the ends makes "ends after t" a binary search even when segments overlap
+        self.max_ends = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+        
+        word_starts, word_ends, _, sentence_ends = word_arrays(transcription)
+        self.word_starts = word_starts
+        self.word_ends = np.sort(word_ends)
+        if len(word_starts):
+            self.sentence_starts = np.concatenate([[word_starts[0]], word_starts[1:][sentence_ends[:-1]]])
+            self.sentence_ends = np.sort(word_ends[sentence_ends])
+        else:
+            self.sentence_starts = self.sentence_ends = word_starts
+    
+    def overlapping(self, start_time, end_time):
+        """Return the segments that overlap [start_time, end_time), in time order"""
+        lo = np.searchsorted(self.max_ends, start_time, side='right')
+        hi = np.searchsorted(self.starts, end_time, side='left')
+        if lo >= hi:
+            return []
+        hits = lo + np.flatnonzero(self.ends[lo:hi] > start_time)
+        return [self.segments[i] for i in hits]
+    
+    def window_text(self, start_time, end_time):
+        """Join the text of the segments overlapping a time window"""
+        return ' '.join(segment['text'].strip() for segment in self.overlapping(start_time, end_time))
+    
+    def snap(self, start_time, end_time, max_shift, max_length=None):
+        """Move clip edges to the nearest sentence (else word) boundary within max_shift seconds"""
+        new_start = nearest_within(self.sentence_starts, start_time, start_time - max_shift, start_time + max_shift)
+        if new_start is None:
+            new_start = nearest_within(self.word_starts, start_time, start_time - max_shift, start_time + max_shift)
+        if new_start is None:
+            new_start = start_time
+        new_start = max(0.0, new_start)
+        
+        limit = end_time + max_shift
+        if max_length is not None:
+            limit = min(limit, new_start + max_length)
+        lower = max(new_start, end_time - max_shift)
+        
+        new_end = nearest_within(self.sentence_ends, end_time, lower, limit)
+        if new_end is None:
+            new_end = nearest_within(self.word_ends, end_time, lower, limit)
+        if new_end is None or new_end <= new_start:
+            new_end = min(end_time, limit)
+        return new_start, new_end
@@ -0,0 +1,108 @@
+import os
+import gzip
+import json
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptStore:
+    def __init__(self, config):
+        """Initialize on-disk transcript store with a size cap"""
+        self.path = config.get('transcript_cache_path', './cache/transcripts')
+        self.max_bytes = config.get('transcript_cache_max_mb', 500) * 1024 * 1024
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        
+        os.makedirs(self.path, exist_ok=True)
+    
+    def content_hash(self, media_path, chunk_size=1 << 20):
+        """Hash the source media file so a re-downloaded copy maps to the same entry"""
+        digest = hashlib.sha256()
+        with open(media_path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        return digest.hexdigest()[:32]
+    
+    def _entry_path(self, video_id, content_hash, settings=None):
+        """Get the file path of a store entry; settings (model, transcribe options) give each combination its own entry"""
+        settings_hash = hashlib.sha256(json.dumps(settings or {}, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.path, f"{video_id}_{content_hash}_{settings_hash}.json.gz")
+    
+    def get(self, video_id, content_hash, settings=None):
+        """Return the stored Whisper result, or None on a miss"""
+        entry_path = self._entry_path(video_id, content_hash, settings)
+        try:
+            with gzip.open(entry_path, 'rt', encoding='utf-8') as f:
+                result = json.load(f)
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable transcript entry {entry_path}: {str(e)}")
+            os.remove(entry_path)
+            with self.lock:
+                self.misses += 1
+            return None
+        
+        # Touch the entry so eviction treats it as recently used
+        os.utime(entry_path)
+        with self.lock:
+            self.hits += 1
+        return result
+    
+    def put(self, video_id, content_hash, result, settings=None):
+        """Store a Whisper result and evict least recently used entries over the size cap"""
+        entry_path = self._entry_path(video_id, content_hash, settings)
+        temp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+                json.dump(result, f, default=lambda value: value.tolist() if hasattr(value, 'tolist') else str(value))
+            os.replace(temp_path, entry_path)
+        except Exception as e:
+            logger.warning(f"Could not store transcript for {video_id}: {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        
+        self._evict(keep=entry_path)
+    
+    def _evict(self, keep=None):
+        """Remove the oldest entries until the store fits in its size cap"""
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.path):
+                if not name.endswith('.json.gz'):
+                    continue
+                entry_path = os.path.join(self.path, name)
+                try:
+                    stat = os.stat(entry_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+            
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if entry_path == keep:
+                    continue
+                try:
+                    os.remove(entry_path)
+                    total -= size
+                    logger.info(f"Evicted transcript {os.path.basename(entry_path)}")
+                except FileNotFoundError:
+                    continue
+    
+    def stats(self):
+        """Return hit/miss counters and current store size"""
+        names = [name for name in os.listdir(self.path) if name.endswith('.json.gz')]
+        size = sum(os.path.getsize(os.path.join(self.path, name)) for name in names)
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(names), 'bytes': size}
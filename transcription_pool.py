@@ -0,0 +1,80 @@
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from ffmpeg_utils import decode_audio, peak_rss_bytes
+from segment_scorer import loudness_profile
+
+logger = logging.getLogger(__name__)
+
+# Whisper models expect 16 kHz mono audio
+WHISPER_SAMPLE_RATE = 16000
+
+# Model held resident by each worker process
+_worker_model = None
+
+
+def load_whisper_model(model_name):
+    """Load a Whisper model (imported lazily so idle processes never pay for torch)"""
+    import whisper
+    logger.info(f"Loading Whisper model: {model_name}")
+    return whisper.load_model(model_name)
+
+
+def _init_worker(model_name):
+    """Load the model once when a worker process starts"""
+    global _worker_model
+    _worker_model = load_whisper_model(model_name)
+
+
+def transcribe_audio(model, audio, options):
+    """Transcribe a media path or PCM array, returning the result and memory/timing stats"""
+    stats = {}
+    if isinstance(audio, str):
+        start = time.time()
+        audio = decode_audio(audio, sample_rate=WHISPER_SAMPLE_RATE)
+        stats['decode_seconds'] = time.time() - start
+    
+    stats['audio_seconds'] = len(audio) / WHISPER_SAMPLE_RATE
+    stats['audio_buffer_bytes'] = audio.nbytes
+    
+    start = time.time()
+    result = model.transcribe(audio, **options)
+    stats['transcribe_seconds'] = time.time() - start
+    # Per-second loudness is cheap to take while the PCM is in memory and feeds the segment scorer
+    result['loudness'] = loudness_profile(audio, WHISPER_SAMPLE_RATE)
+    # Lifetime high-water mark of the process that transcribed, not a per-video figure
+    stats['process_peak_rss_bytes'] = peak_rss_bytes()
+    return result, stats
+
+
+def _transcribe_job(audio, options):
+    """Run one transcription job on the worker's resident model"""
+    return transcribe_audio(_worker_model, audio, options)
+
+
+class TranscriptionPool:
+    def __init__(self, model_name, workers):
+        """Start a pool of worker processes that each keep one Whisper model loaded"""
+        self.workers = workers
+        # Spawned rather than forked: the parent may already run threads and have torch/OpenMP loaded,
+        # and each worker loads its own model anyway
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(model_name,)
+        )
+    
+    def submit(self, audio, **options):
+        """Queue a media path or PCM array for transcription and return a future"""
+        return self.executor.submit(_transcribe_job, audio, options)
+    
+    def transcribe(self, audio, **options):
+        """Transcribe on the pool and wait for the result"""
+        return self.submit(audio, **options).result()
+    
+    def shutdown(self):
+        """Stop the worker processes"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
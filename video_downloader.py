@@ -1,64 +1,160 @@
 import os
 import time
 import logging
+import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import requests
 import feedparser
 from pytube import YouTube
-from moviepy.editor import VideoFileClip, AudioFileClip
 from moviepy.config import change_settings
 import yt_dlp
 import subprocess
 
+from state_store import StateStore
+from ffmpeg_utils import run_ffmpeg
+from ranged_download import RangedDownloader
+from encode_profiles import resolve_profile, video_args, audio_args
+from metrics import timed, BYTES_TRANSFERRED
+
 change_settings({"IMAGEMAGICK_BINARY": r"D:\\program files\\ImageMagick-7.1.1-Q16-HDRI\\magick.exe"})
 
 logger = logging.getLogger(__name__)
 
+FEED_CACHE_FILE = 'feed_cache.json'
+
 class VideoDownloader:
     def __init__(self, config):
         """Initialize video downloader with configuration"""
         self.config = config
-        self.processed_videos = self.load_processed_videos()
+        self.lock = threading.Lock()
+        
+        # Job state lives in SQLite; the old processed_videos.json is imported on first start
+        self.state = StateStore(self.config.get('state_db', 'state.db'))
+        self.state.import_processed_json('processed_videos.json')
+        
+        # Pooled HTTP client shared by concurrent feed polls
+        self.session = requests.Session()
+        pool_size = self.config.get('feed_workers', 16)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.feed_cache = self.load_feed_cache()
+        self.feed_stats = {}
+        
+        # Media files are fetched as parallel byte ranges that resume across retries
+        self.ranged = RangedDownloader(
+            self.session,
+            workers=self.config.get('download_workers', 4),
+            chunk_size=int(self.config.get('download_chunk_mb', 8) * (1 << 20))
+        )
     
-    def load_processed_videos(self):
-        """Load list of already processed videos"""
+    def load_feed_cache(self):
+        """Load stored ETag/Last-Modified validators and entries of each feed"""
         import json
-        processed_file = 'processed_videos.json'
-        if os.path.exists(processed_file):
-            with open(processed_file, 'r') as f:
-                return set(json.load(f))
-        return set()
+        if os.path.exists(FEED_CACHE_FILE):
+            try:
+                with open(FEED_CACHE_FILE, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable feed cache: {str(e)}")
+        return {}
     
-    def save_processed_videos(self):
-        """Save list of processed videos"""
+    def save_feed_cache(self):
+        """Save feed validators and entries"""
         import json
-        with open('processed_videos.json', 'w') as f:
-            json.dump(list(self.processed_videos), f)
+        with self.lock:
+            with open(FEED_CACHE_FILE, 'w') as f:
+                json.dump(self.feed_cache, f)
+    
+    def fetch_feed(self, channel_name, rss_url):
+        """Fetch one feed with a conditional GET and return its entries"""
+        cached = self.feed_cache.get(rss_url, {})
+        headers = {}
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+        
+        start = time.time()
+        stats = {'status': None, 'elapsed': 0.0, 'bytes': 0, 'entries': 0}
+        try:
+            response = self.session.get(rss_url, headers=headers, timeout=self.config.get('feed_timeout', 10))
+            stats['status'] = response.status_code
+            stats['bytes'] = len(response.content)
+            
+            if response.status_code == 304 and 'entries' in cached:
+                # Unchanged since the last poll: reuse the entries parsed back then
+                entries = cached['entries']
+            else:
+                response.raise_for_status()
+                feed = feedparser.parse(response.content)
+                entries = [
+                    {
+                        'video_id': entry.yt_videoid,
+                        'title': entry.title,
+                        'published': datetime(*entry.published_parsed[:6]).isoformat()
+                    }
+                    for entry in feed.entries
+                ]
+                with self.lock:
+                    self.feed_cache[rss_url] = {
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                        'entries': entries
+                    }
+            
+            stats['entries'] = len(entries)
+            return entries
+        
+        except Exception as e:
+            stats['status'] = 'error'
+            logger.error(f"Error checking {channel_name}: {str(e)}")
+            return []
+        finally:
+            stats['elapsed'] = time.time() - start
+            self.feed_stats[channel_name] = stats
+            BYTES_TRANSFERRED.inc(stats['bytes'], kind='feed')
     
+    @timed('feed_poll')
     def check_new_videos(self):
         """Check for new videos from monitored channels"""
-        new_videos = []
+        channels = list(self.config['channels'].items())
+        if not channels:
+            return []
         
-        for channel_name, channel_info in self.config['channels'].items():
-            try:
-                feed = feedparser.parse(channel_info['rss_url'])
+        start = time.time()
+        workers = min(self.config.get('feed_workers', 16), len(channels))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            feeds = list(executor.map(
+                lambda channel: self.fetch_feed(channel[0], channel[1]['rss_url']), channels
+            ))
+        self.save_feed_cache()
+        
+        new_videos = []
+        for (channel_name, channel_info), entries in zip(channels, feeds):
+            for entry in entries:
+                video_id = entry['video_id']
+                video_url = f"https://www.youtube.com/watch?v={video_id}"
                 
-                for entry in feed.entries:
-                    video_id = entry.yt_videoid
-                    video_url = f"https://www.youtube.com/watch?v={video_id}"
-                    
-                    # Check if video is new (within last 24 hours) and not processed
-                    published_time = datetime(*entry.published_parsed[:6])
-                    if (datetime.now() - published_time).days == 0 and video_id not in self.processed_videos:
-                        new_videos.append({
-                            'channel': channel_name,
-                            'video_id': video_id,
-                            'url': video_url,
-                            'title': entry.title,
-                            'published': published_time
-                        })
-                        
-            except Exception as e:
-                logger.error(f"Error checking {channel_name}: {str(e)}")
+                # Check if video is new (within last 24 hours) and not processed
+                published_time = datetime.fromisoformat(entry['published'])
+                if (datetime.now() - published_time).days == 0 and not self.state.is_known(video_id):
+                    new_videos.append({
+                        'channel': channel_name,
+                        'video_id': video_id,
+                        'url': video_url,
+                        'title': entry['title'],
+                        'published': published_time
+                    })
+        
+        not_modified = sum(1 for stats in self.feed_stats.values() if stats['status'] == 304)
+        errors = sum(1 for stats in self.feed_stats.values() if stats['status'] == 'error')
+        slowest = max(self.feed_stats.items(), key=lambda item: item[1]['elapsed'])
+        logger.info(
+            f"Polled {len(channels)} feeds in {time.time() - start:.1f}s "
+            f"({not_modified} not modified, {errors} errors, slowest {slowest[0]} {slowest[1]['elapsed']:.2f}s)"
+        )
         
         return new_videos
     
@@ -75,6 +171,11 @@ class VideoDownloader:
             }
             
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(video_url, download=False)
+                if info.get('url') and info.get('protocol') in ('http', 'https'):
+                    # Plain HTTP format: fetch it ourselves as parallel ranges
+                    destination = os.path.join(output_path, f"{video_id}.{info.get('ext', 'mp4')}")
+                    return self.ranged.download(info['url'], destination, info.get('http_headers'))
                 ydl.download([video_url])
                 
             # Find the downloaded file
@@ -88,6 +189,111 @@ class VideoDownloader:
             logger.error(f"Error downloading with yt-dlp {video_url}: {str(e)}")
             return None
     
+    def resolve_streams(self, video_url):
+        """Resolve direct URLs of the best video-only and audio-only streams without downloading"""
+        with yt_dlp.YoutubeDL({'quiet': True, 'noplaylist': True}) as ydl:
+            info = ydl.extract_info(video_url, download=False)
+        
+        formats = [f for f in info.get('formats', []) if f.get('url') and f.get('protocol') in ('http', 'https')]
+        video_formats = [
+            f for f in formats
+            if f.get('vcodec') not in (None, 'none') and f.get('acodec') == 'none' and f.get('ext') == 'mp4'
+        ]
+        audio_formats = [f for f in formats if f.get('acodec') not in (None, 'none') and f.get('vcodec') == 'none']
+        if not video_formats or not audio_formats:
+            raise RuntimeError("No separate video and audio streams available")
+        
+        video_format = max(video_formats, key=lambda f: (f.get('height') or 0, f.get('tbr') or 0))
+        audio_format = max(audio_formats, key=lambda f: (f.get('ext') == 'm4a', f.get('abr') or 0))
+        return {
+            'video_id': info['id'],
+            'duration': info.get('duration'),
+            'video_url': video_format['url'],
+            'audio_url': audio_format['url'],
+            'audio_ext': audio_format.get('ext', 'm4a'),
+            'http_headers': info.get('http_headers') or video_format.get('http_headers') or {}
+        }
+    
+    def download_audio(self, video_url, output_path):
+        """Download only the audio stream of a video, returning its path and the resolved stream URLs"""
+        try:
+            streams = self.resolve_streams(video_url)
+            audio_path = os.path.join(output_path, f"{streams['video_id']}_audio.{streams['audio_ext']}")
+            start = time.time()
+            self.ranged.download(streams['audio_url'], audio_path, streams['http_headers'])
+            logger.info(
+                f"Downloaded audio only ({os.path.getsize(audio_path) / 1e6:.1f} MB) "
+                f"in {time.time() - start:.1f}s: {audio_path}"
+            )
+            return audio_path, streams
+        except Exception as e:
+            logger.error(f"Error downloading audio for {video_url}: {str(e)}")
+            return None, None
+    
+    def download_sections(self, streams, segments, output_path, margin=2.0):
+        """Fetch only the parts of the video covering the segments (plus a margin) by stream-copying ranges"""
+        # Merge the padded segment windows so overlapping clips share one section
+        windows = []
+        for segment in sorted(segments, key=lambda segment: segment['start_time']):
+            start = max(0.0, segment['start_time'] - margin)
+            end = segment['end_time'] + margin
+            if windows and start <= windows[-1][1]:
+                windows[-1][1] = max(windows[-1][1], end)
+            else:
+                windows.append([start, end])
+        
+        headers = ''.join(f"{name}: {value}\r\n" for name, value in streams.get('http_headers', {}).items())
+        header_args = ['-headers', headers] if headers else []
+        
+        sections = []
+        for i, (start, end) in enumerate(windows):
+            section_path = os.path.join(output_path, f"{streams['video_id']}_section{i}_{int(start)}.mp4")
+            started = time.time()
+            # ffmpeg seeks inside the remote files with HTTP range requests
+            run_ffmpeg(
+                header_args + ['-ss', f"{start:.3f}", '-t', f"{end - start:.3f}", '-i', streams['video_url']]
+                + header_args + ['-ss', f"{start:.3f}", '-t', f"{end - start:.3f}", '-i', streams['audio_url']]
+                + ['-map', '0:v:0', '-map', '1:a:0', '-c', 'copy', section_path]
+            )
+            if not os.path.exists(section_path) or os.path.getsize(section_path) == 0:
+                raise RuntimeError(f"Section {start:.0f}-{end:.0f}s came back empty (server may not support range requests)")
+            logger.info(
+                f"Fetched section {start:.0f}-{end:.0f}s ({os.path.getsize(section_path) / 1e6:.1f} MB) "
+                f"in {time.time() - started:.1f}s"
+            )
+            BYTES_TRANSFERRED.inc(os.path.getsize(section_path), kind='section')
+            sections.append({'path': section_path, 'start': start, 'end': end})
+        
+        # Point every segment at the section that contains it
+        located = []
+        for segment in segments:
+            section = next(s for s in sections if s['start'] <= segment['start_time'] and segment['end_time'] <= s['end'])
+            located.append(dict(segment, source_path=section['path'], source_offset=section['start']))
+        return located, [section['path'] for section in sections]
+    
+    def merge_streams(self, video_path, audio_path, merged_path):
+        """Mux separate video and audio files into one mp4, copying the streams when the codecs allow it"""
+        start = time.time()
+        inputs = ['-i', video_path, '-i', audio_path, '-map', '0:v:0', '-map', '1:a:0', '-shortest']
+        try:
+            run_ffmpeg(inputs + ['-c', 'copy', '-movflags', '+faststart', merged_path])
+            logger.info(f"Remuxed video and audio in {time.time() - start:.1f}s: {merged_path}")
+        except Exception as e:
+            logger.warning(f"Stream copy not possible ({str(e)}), transcoding instead")
+            try:
+                _, profile = resolve_profile(
+                    self.config.get('merge_encode_profile', 'fast'),
+                    self.config.get('encode_calibration_path', 'encode_calibration.json')
+                )
+                run_ffmpeg(inputs + video_args(profile) + audio_args(profile) + ['-movflags', '+faststart', merged_path])
+            except Exception:
+                if os.path.exists(merged_path):
+                    os.remove(merged_path)
+                raise
+            logger.info(f"Transcoded video and audio in {time.time() - start:.1f}s: {merged_path}")
+        return merged_path
+    
+    @timed('download')
     def download_video(self, video_url, output_path):
         """Download video from YouTube with fallback methods"""
         max_retries = 3
@@ -110,28 +316,28 @@ class VideoDownloader:
                         audio_stream = yt.streams.filter(adaptive=True, file_extension='mp4', only_audio=True).order_by('abr').desc().first()
                         
                         if video_stream and audio_stream:
-                            video_path = video_stream.download(output_path, filename_prefix='video_')
-                            audio_path = audio_stream.download(output_path, filename_prefix='audio_')
-                            
-                            # Merge video and audio using moviepy
-                            video_clip = VideoFileClip(video_path)
-                            audio_clip = AudioFileClip(audio_path)
-                            final_clip = video_clip.set_audio(audio_clip)
-                            
-                            merged_path = os.path.join(output_path, f"merged_{yt.video_id}.mp4")
-                            final_clip.write_videofile(merged_path, codec='libx264', audio_codec='aac')
-                            
-                            # Clean up temporary files
-                            os.remove(video_path)
-                            os.remove(audio_path)
-                            video_clip.close()
-                            audio_clip.close()
-                            final_clip.close()
+                            video_path = None
+                            audio_path = None
+                            try:
+                                video_path = self.ranged.download(
+                                    video_stream.url, os.path.join(output_path, 'video_' + video_stream.default_filename)
+                                )
+                                audio_path = self.ranged.download(
+                                    audio_stream.url, os.path.join(output_path, 'audio_' + audio_stream.default_filename)
+                                )
+                                
+                                merged_path = os.path.join(output_path, f"merged_{yt.video_id}.mp4")
+                                self.merge_streams(video_path, audio_path, merged_path)
+                            finally:
+                                # Clean up temporary files
+                                for temp_path in (video_path, audio_path):
+                                    if temp_path and os.path.exists(temp_path):
+                                        os.remove(temp_path)
                             
                             logger.info(f"Successfully downloaded with pytube: {merged_path}")
                             return merged_path
                     else:
-                        video_path = video_stream.download(output_path, filename=f"{yt.video_id}.mp4")
+                        video_path = self.ranged.download(video_stream.url, os.path.join(output_path, f"{yt.video_id}.mp4"))
                         logger.info(f"Successfully downloaded with pytube: {video_path}")
                         return video_path
                         
@@ -165,5 +371,4 @@ class VideoDownloader:
     
     def mark_as_processed(self, video_id):
         """Mark video as processed"""
-        self.processed_videos.add(video_id)
-        self.save_processed_videos() 
\ No newline at end of file
+        self.state.mark_done(video_id)
@@ -2,40 +2,166 @@ import os
 import time
 import json
 import logging
-import whisper
-from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from moviepy.editor import VideoFileClip, ImageClip, CompositeVideoClip
 from moviepy.config import change_settings
 import openai
 
+from caption_renderer import CaptionRenderer
+from transcript_store import TranscriptStore
+from transcription_pool import TranscriptionPool, WHISPER_SAMPLE_RATE, load_whisper_model, transcribe_audio
+from long_form import find_split_points, stitch_transcriptions
+from segment_scorer import SegmentScorer, loudness_profile
+from transcript_index import TranscriptIndex
+from smart_crop import SmartCropper
+from scene_index import SceneIndexStore
+from encode_profiles import resolve_profile, video_args, audio_args, moviepy_kwargs
+from metrics import timed, STAGE_FAILURES, ENCODE_FPS, FRAMES_ENCODED
+from ffmpeg_utils import run_ffmpeg, probe_media, escape_filter_path, format_ass_timestamp, decode_audio, peak_rss_bytes
+
 change_settings({"IMAGEMAGICK_BINARY": r"D:\\program files\\ImageMagick-7.1.1-Q16-HDRI\\magick.exe"})
 
 logger = logging.getLogger(__name__)
 
+# Output format for TikTok clips
+TARGET_WIDTH = 1080
+TARGET_HEIGHT = 1920
+
+# Transcript indexes kept for the most recent transcriptions
+INDEX_CACHE_SIZE = 4
+
+# Candidates asked for per transcript window in chunked analysis
+ANALYSIS_PICKS_PER_WINDOW = 3
+
+# Caption styling shared by both render engines
+CAPTION_FONT_SIZE = 60
+CAPTION_STROKE_WIDTH = 3
+CAPTION_MARGIN = 50
+
 class VideoProcessor:
     def __init__(self, config):
         """Initialize video processor with configuration"""
         self.config = config
-        self.whisper_model = whisper.load_model("base")
+        self.caption_renderer = CaptionRenderer(config)
+        self.transcript_store = TranscriptStore(config)
+        self.segment_scorer = SegmentScorer(config)
+        self.smart_cropper = SmartCropper(config)
+        self.scene_indexes = SceneIndexStore(config)
+        self._indexes = OrderedDict()
+        self._index_lock = threading.Lock()
+        self.llm_stats = {'requests': 0, 'seconds': 0.0}
+        self._stats_lock = threading.Lock()
+        
+        # Encoder settings for clips; "auto" uses the profile calibrated on this machine
+        self.encode_profile_name, self.encode_profile = resolve_profile(
+            self.config.get('encode_profile', 'auto'),
+            self.config.get('encode_calibration_path', 'encode_calibration.json')
+        )
+        logger.info(f"Encoding clips with the {self.encode_profile_name} profile")
+        
+        # The Whisper model (or worker pool) is created on first transcription
+        self._whisper_model = None
+        self._transcription_pool = None
+        self._long_form_pool = None
+        self._model_lock = threading.Lock()
+    
+    @property
+    def whisper_model(self):
+        """Whisper model for in-process transcription, loaded on first use"""
+        with self._model_lock:
+            if self._whisper_model is None:
+                self._whisper_model = load_whisper_model(self.config.get('whisper_model', 'base'))
+            return self._whisper_model
+    
+    @property
+    def transcription_pool(self):
+        """Pool of worker processes with resident models, or None when transcribing in-process"""
+        workers = self.config.get('transcription_workers', 0)
+        if workers <= 0:
+            return None
+        with self._model_lock:
+            if self._transcription_pool is None:
+                self._transcription_pool = TranscriptionPool(self.config.get('whisper_model', 'base'), workers)
+            return self._transcription_pool
+    
+    @property
+    def long_form_pool(self):
+        """Pool for the chunks of a long video: the transcription pool, else a dedicated one started on first use"""
+        pool = self.transcription_pool
+        if pool:
+            return pool
+        workers = self.config.get('long_form_workers', 2)
+        if workers <= 1:
+            return None
+        with self._model_lock:
+            if self._long_form_pool is None:
+                self._long_form_pool = TranscriptionPool(self.config.get('whisper_model', 'base'), workers)
+            return self._long_form_pool
+    
+    def transcript_index(self, transcription):
+        """Return the time index of a transcription, building it once per transcription"""
+        with self._index_lock:
+            # Keyed by identity; the entry holds the transcription so its id is not reused while cached
+            entry = self._indexes.get(id(transcription))
+            if entry is not None and entry[0] is transcription:
+                self._indexes.move_to_end(id(transcription))
+                return entry[1]
+            
+            index = TranscriptIndex(transcription)
+            self._indexes[id(transcription)] = (transcription, index)
+            while len(self._indexes) > INDEX_CACHE_SIZE:
+                self._indexes.popitem(last=False)
+            return index
+    
+    def close(self):
+        """Release the transcription worker pools"""
+        if self._transcription_pool:
+            self._transcription_pool.shutdown()
+            self._transcription_pool = None
+        if self._long_form_pool:
+            self._long_form_pool.shutdown()
+            self._long_form_pool = None
     
-    def extract_audio_and_transcribe(self, video_path):
+    @timed('transcribe')
+    def extract_audio_and_transcribe(self, video_path, video_id=None):
         """Extract audio from video and generate transcription with timestamps"""
         try:
-            # Load video and extract audio
-            video = VideoFileClip(video_path)
-            audio_path = video_path.replace('.mp4', '.wav')
-            video.audio.write_audiofile(audio_path, verbose=False, logger=None)
-            video.close()
-            
-            # Transcribe audio with timestamps
-            result = self.whisper_model.transcribe(
-                audio_path,
-                word_timestamps=True,
-                verbose=False,
-                fp16=False  # Force FP32 to avoid warnings
-            )
+            if video_id is None:
+                video_id = os.path.splitext(os.path.basename(video_path))[0]
+            
+            # Audio is decoded straight from the container into memory and transcribed with timestamps
+            options = {
+                'word_timestamps': True,
+                'verbose': False,
+                'fp16': False  # Force FP32 to avoid warnings
+            }
+            # Reuse a stored transcription of the same source, model and options before decoding anything
+            settings = {'model': self.config.get('whisper_model', 'base'), 'options': options}
+            content_hash = self.transcript_store.content_hash(video_path)
+            result = self.transcript_store.get(video_id, content_hash, settings)
+            if result is not None:
+                logger.info(f"Using stored transcription for {video_id} ({self.transcript_store.stats()})")
+                return result
+            
+            threshold = self.config.get('long_form_threshold', 1800)
+            if threshold and probe_media(video_path)['duration'] > threshold:
+                result, stats = self._transcribe_long_form(video_path, options)
+            else:
+                result, stats = self._transcribe(video_path, options)
+            
+            self.transcript_store.put(video_id, content_hash, result, settings)
             
-            # Clean up audio file
-            os.remove(audio_path)
+            # The audio buffer is this video's footprint; the peak RSS is the process high-water mark so far
+            peak_rss = stats['process_peak_rss_bytes']
+            logger.info(
+                f"Transcribed {stats['audio_seconds']:.0f}s of audio for {video_id}: "
+                f"decode {stats['decode_seconds']:.1f}s, transcribe {stats['transcribe_seconds']:.1f}s, "
+                f"audio buffer {stats['audio_buffer_bytes'] / 1e6:.1f} MB"
+                + (f", process peak memory so far {peak_rss / 1e6:.1f} MB" if peak_rss is not None else "")
+            )
             
             return result
             
@@ -43,202 +169,703 @@ class VideoProcessor:
             logger.error(f"Error transcribing {video_path}: {str(e)}")
             return None
     
-    def find_interesting_segments(self, transcription, video_duration):
-        """Use AI to find interesting segments for short-form content"""
+    def _transcribe(self, audio, options):
+        """Transcribe a media path or PCM array on the worker pool, or in-process without one"""
+        pool = self.transcription_pool
+        if pool:
+            return pool.transcribe(audio, **options)
+        
+        model = self.whisper_model
+        with self._model_lock:
+            return transcribe_audio(model, audio, options)
+    
+    def _transcribe_long_form(self, video_path, options):
+        """Split long audio at silences, transcribe the chunks in parallel and stitch the results"""
+        start = time.time()
+        audio = decode_audio(video_path, sample_rate=WHISPER_SAMPLE_RATE)
+        decode_seconds = time.time() - start
+        
+        splits = find_split_points(
+            audio, WHISPER_SAMPLE_RATE,
+            self.config.get('long_form_chunk_seconds', 600),
+            self.config.get('long_form_search_seconds', 30)
+        )
+        bounds = list(zip([0] + splits, splits + [len(audio)]))
+        logger.info(f"Transcribing {len(audio) / WHISPER_SAMPLE_RATE:.0f}s of audio in {len(bounds)} chunks")
+        
+        start = time.time()
+        pool = self.long_form_pool
+        if pool:
+            futures = [pool.submit(audio[lo:hi], **options) for lo, hi in bounds]
+            chunk_results = [future.result()[0] for future in futures]
+        else:
+            chunk_results = [self._transcribe(audio[lo:hi], options)[0] for lo, hi in bounds]
+        
+        result = stitch_transcriptions(
+            chunk_results,
+            [lo / WHISPER_SAMPLE_RATE for lo, _ in bounds],
+            [hi / WHISPER_SAMPLE_RATE for _, hi in bounds]
+        )
+        result['loudness'] = loudness_profile(audio, WHISPER_SAMPLE_RATE)
+        stats = {
+            'decode_seconds': decode_seconds,
+            'audio_seconds': len(audio) / WHISPER_SAMPLE_RATE,
+            'audio_buffer_bytes': audio.nbytes,
+            'transcribe_seconds': time.time() - start,
+            'process_peak_rss_bytes': peak_rss_bytes()
+        }
+        return result, stats
+    
+    @timed('segment')
+    def find_interesting_segments(self, transcription, video_duration, scene_index=None):
+        """Score candidate windows locally, then use AI to pick the most interesting of the top candidates"""
+        max_clips = self.config['max_clips_per_video']
+        index = self.transcript_index(transcription)
+        
+        # The local scorer covers the whole video and doubles as the offline fallback
+        start = time.time()
+        candidates = self.segment_scorer.top_segments(
+            transcription, video_duration, max(max_clips, self.config.get('llm_candidates', 10))
+        )
+        logger.info(f"Scored candidate windows locally in {(time.time() - start) * 1000:.1f} ms")
+        
+        if self.config.get('segment_analysis', 'prefilter') == 'map_reduce':
+            segments = self._map_reduce_segments(transcription, index, video_duration)
+            if segments:
+                return self._snap_segments(index, segments, video_duration, scene_index)
+            logger.warning("Chunked analysis found no usable segments, using local scores")
+            return self._snap_segments(index, candidates[:max_clips], video_duration, scene_index)
+        
         try:
-            # Prepare text for analysis
-            full_text = transcription['text']
-            segments = transcription['segments']
-            
-            # Use OpenAI to identify interesting moments
-            openai.api_key = self.config['openai_api_key']
+            candidate_text = '\n'.join(
+                f"[{i}] {candidate['start_time']:.0f}s-{candidate['end_time']:.0f}s: "
+                f"{index.window_text(candidate['start_time'], candidate['end_time'])[:800]}"
+                for i, candidate in enumerate(candidates)
+            )
             
             prompt = f"""
-            Analyze this video transcript and identify the most engaging segments for TikTok short-form content (60 seconds each).
-            Look for:
+            These are candidate segments of a video transcript for TikTok short-form content.
+            Pick the most engaging ones. Look for:
             - Controversial or surprising statements
             - Valuable tips or insights
             - Emotional moments
             - Clear explanations of complex topics
             - Hooks that grab attention
             
-            Transcript: {full_text[:4000]}...
+            Candidates:
+            {candidate_text}
             
-            Return a JSON list of segments with start_time, end_time, reason, and suggested_title.
-            Limit to maximum 5 segments.
+            Return a JSON list of objects with candidate (the number in brackets), reason, and suggested_title.
+            Limit to maximum {max_clips} segments.
             """
             
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7
-            )
-            
-            ai_segments = json.loads(response.choices[0].message.content)
+            # Use OpenAI to identify interesting moments
+            ai_segments = json.loads(self._chat(prompt, 0.7))
             
-            # Validate and adjust segments based on actual timestamps
+            # Map the picks back to the scored windows
             validated_segments = []
+            picked = set()
             for segment in ai_segments:
-                start_time = max(0, segment['start_time'])
-                end_time = min(video_duration, segment['end_time'])
-                
-                if end_time - start_time >= 30:  # Minimum 30 seconds
-                    validated_segments.append({
-                        'start_time': start_time,
-                        'end_time': min(start_time + self.config['clip_duration'], end_time),
-                        'reason': segment['reason'],
-                        'title': segment['suggested_title']
-                    })
+                pick = int(segment['candidate'])
+                if pick in picked or not 0 <= pick < len(candidates):
+                    continue
+                picked.add(pick)
+                validated_segments.append({
+                    'start_time': candidates[pick]['start_time'],
+                    'end_time': candidates[pick]['end_time'],
+                    'reason': segment['reason'],
+                    'title': segment['suggested_title']
+                })
             
-            return validated_segments[:self.config['max_clips_per_video']]
+            if validated_segments:
+                return self._snap_segments(index, validated_segments[:max_clips], video_duration, scene_index)
+            logger.warning("AI returned no usable segments, using local scores")
             
         except Exception as e:
             logger.error(f"Error finding segments: {str(e)}")
-            # Fallback: create segments every 2 minutes
-            segments = []
-            duration = self.config['clip_duration']
-            for i in range(0, int(video_duration), 120):  # Every 2 minutes
-                if len(segments) >= self.config['max_clips_per_video']:
-                    break
-                segments.append({
-                    'start_time': i,
-                    'end_time': min(i + duration, video_duration),
-                    'reason': 'Auto-generated segment',
-                    'title': f'Clip {len(segments) + 1}'
-                })
-            return segments
+        
+        # Fallback: the best locally scored windows
+        return self._snap_segments(index, candidates[:max_clips], video_duration, scene_index)
     
-    def create_vertical_video_with_captions(self, video_path, segment, transcription, output_path):
-        """Create vertical 9:16 video with captions"""
-        try:
-            # Load video
-            video = VideoFileClip(video_path).subclip(segment['start_time'], segment['end_time'])
-            
-            # Resize to vertical format (9:16)
-            target_width = 1080
-            target_height = 1920
+    def _map_reduce_segments(self, transcription, index, video_duration):
+        """Analyze the whole transcript in timestamped windows concurrently, then rank and merge the picks locally"""
+        window = self.config.get('analysis_window_seconds', 600)
+        bounds = []
+        window_start = 0.0
+        while window_start < video_duration:
+            bounds.append((window_start, min(window_start + window, video_duration)))
+            window_start += window
+        
+        # Map: one request per window, never more than analysis_concurrency in flight
+        start = time.time()
+        workers = max(1, min(len(bounds), self.config.get('analysis_concurrency', 4)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._analyze_window, index, lo, hi, video_duration) for lo, hi in bounds]
+        
+        found = []
+        failed = 0
+        for (lo, hi), future in zip(bounds, futures):
+            try:
+                found.extend(future.result())
+            except Exception as e:
+                failed += 1
+                logger.warning(f"Error analyzing transcript window {lo:.0f}-{hi:.0f}s: {str(e)}")
+        logger.info(
+            f"Analyzed {len(bounds)} transcript windows ({failed} failed, {len(found)} candidates) "
+            f"with {workers} concurrent requests in {time.time() - start:.1f}s"
+        )
+        if not found:
+            return []
+        
+        # Reduce: rank by the model's score, break ties with the local score, and drop overlaps
+        _, _, local_scores, _ = self.segment_scorer.score_windows(transcription, video_duration)
+        for candidate in found:
+            candidate['local_score'] = float(local_scores[min(int(candidate['start_time']), len(local_scores) - 1)])
+        found.sort(key=lambda candidate: (candidate['score'], candidate['local_score']), reverse=True)
+        
+        chosen = []
+        for candidate in found:
+            if len(chosen) >= self.config['max_clips_per_video']:
+                break
+            if any(candidate['start_time'] < other['end_time'] and candidate['end_time'] > other['start_time'] for other in chosen):
+                continue
+            chosen.append(candidate)
+        
+        return [
+            {
+                'start_time': candidate['start_time'],
+                'end_time': candidate['end_time'],
+                'reason': candidate['reason'],
+                'title': candidate['title']
+            }
+            for candidate in sorted(chosen, key=lambda candidate: candidate['start_time'])
+        ]
+    
+    def _analyze_window(self, index, window_start, window_end, video_duration):
+        """Ask the AI for the best clips starting inside one window of the timestamped transcript"""
+        clip_duration = self.config['clip_duration']
+        # Include one clip length past the window so clips starting near its end can be judged whole
+        lines = '\n'.join(
+            f"[{segment['start']:.0f}-{segment['end']:.0f}] {segment['text'].strip()}"
+            for segment in index.overlapping(window_start, min(window_end + clip_duration, video_duration))
+        )
+        if not lines:
+            return []
+        
+        prompt = f"""
+            This is part of a timestamped video transcript (times in seconds).
+            Identify the most engaging segments for TikTok short-form content ({clip_duration} seconds each)
+            that start between {window_start:.0f}s and {window_end:.0f}s.
+            Look for:
+            - Controversial or surprising statements
+            - Valuable tips or insights
+            - Emotional moments
+            - Clear explanations of complex topics
+            - Hooks that grab attention
             
-            # Calculate crop/resize parameters
-            video_aspect = video.w / video.h
-            target_aspect = target_width / target_height
+            Transcript:
+            {lines}
             
-            if video_aspect > target_aspect:
-                # Video is wider, crop width
-                new_width = int(video.h * target_aspect)
-                video = video.crop(x_center=video.w/2, width=new_width)
+            Return a JSON list of segments with start_time, end_time, reason, suggested_title and score (1-10, how engaging).
+            Limit to maximum {ANALYSIS_PICKS_PER_WINDOW} segments.
+            """
+        
+        candidates = []
+        for item in json.loads(self._chat(prompt, 0.7))[:ANALYSIS_PICKS_PER_WINDOW]:
+            start_time = float(item['start_time'])
+            if not window_start <= start_time < window_end:
+                continue
+            end_time = min(float(item.get('end_time', 0)), start_time + clip_duration, video_duration)
+            if end_time - start_time < 30:  # Minimum 30 seconds
+                end_time = min(start_time + clip_duration, video_duration)
+            candidates.append({
+                'start_time': start_time,
+                'end_time': end_time,
+                'reason': item.get('reason', ''),
+                'title': item.get('suggested_title') or f"Clip at {start_time:.0f}s",
+                'score': float(item.get('score', 0))
+            })
+        return candidates
+    
+    def _snap_segments(self, index, segments, video_duration, scene_index=None):
+        """Align segment edges with sentence or word boundaries so clips don't cut speech mid-word, then with shot cuts or keyframes"""
+        max_shift = self.config.get('segment_snap_seconds', 3)
+        scene_shift = self.config.get('scene_snap_seconds', 1.5)
+        snapped = []
+        for segment in segments:
+            start_time, end_time = index.snap(
+                segment['start_time'], segment['end_time'], max_shift, self.config['clip_duration']
+            )
+            if scene_index is not None:
+                start_time, end_time = scene_index.snap(start_time, end_time, scene_shift, self.config['clip_duration'])
+            end_time = min(end_time, video_duration)
+            if end_time > start_time:
+                snapped.append(dict(segment, start_time=start_time, end_time=end_time))
+        return snapped
+    
+    def create_vertical_video_with_captions(self, video_path, segment, transcription, output_path):
+        """Create vertical 9:16 video with captions"""
+        return self.create_vertical_videos_with_captions(video_path, [segment], transcription, output_path)[0]
+    
+    @timed('render')
+    def create_vertical_videos_with_captions(self, video_path, segments, transcription, output_path):
+        """Create vertical clips for all segments of a video, decoding the source once per group of nearby segments"""
+        start = time.perf_counter()
+        output_paths = [self._clip_output_path(segment, output_path, i) for i, segment in enumerate(segments)]
+        results = [None] * len(segments)
+        crop_paths = self._crop_paths(segments, video_path)
+        
+        if self.config.get('render_engine', 'ffmpeg') == 'ffmpeg':
+            groups = self._group_segments(list(range(len(segments))), segments)
+            workers = max(1, min(len(groups), self.config.get('render_workers', 2)))
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {}
+                for group in groups:
+                    source_path = segments[group[0]].get('source_path', video_path)
+                    future = executor.submit(
+                        self._render_group_with_ffmpeg, source_path,
+                        [segments[i] for i in group], transcription,
+                        [output_paths[i] for i in group], threads, crop_paths.get(source_path)
+                    )
+                    futures[future] = group
+                for future in as_completed(futures):
+                    group = futures[future]
+                    try:
+                        future.result()
+                        for i in group:
+                            results[i] = output_paths[i]
+                    except Exception as e:
+                        logger.warning(f"ffmpeg render of {len(group)} clip(s) failed, falling back to moviepy: {str(e)}")
+        
+        # Segments may point at their own downloaded section instead of the full video
+        pending = {}
+        for i in range(len(segments)):
+            if results[i] is None:
+                pending.setdefault(segments[i].get('source_path', video_path), []).append(i)
+        
+        for source_path, indices in pending.items():
+            try:
+                source = VideoFileClip(source_path)
+            except Exception as e:
+                logger.error(f"Error creating vertical video: {str(e)}")
+                continue
+            
+            try:
+                for i in indices:
+                    try:
+                        results[i] = self._render_with_moviepy(
+                            source, segments[i], transcription, output_paths[i], crop_paths.get(source_path)
+                        )
+                    except Exception as e:
+                        logger.error(f"Error creating vertical video: {str(e)}")
+            finally:
+                source.close()
+        
+        # Output frames per second of render time, over the clips that made it
+        frames = sum((segment['end_time'] - segment['start_time']) * 30 for segment, result in zip(segments, results) if result)
+        elapsed = time.perf_counter() - start
+        if frames and elapsed > 0:
+            FRAMES_ENCODED.inc(frames)
+            ENCODE_FPS.observe(frames / elapsed, engine=self.config.get('render_engine', 'ffmpeg'))
+        failed = sum(1 for result in results if result is None)
+        if failed:
+            STAGE_FAILURES.inc(failed, stage='render')
+        
+        return results
+    
+    def render_settings(self):
+        """Settings that change the bytes of a rendered clip"""
+        return {
+            'engine': self.config.get('render_engine', 'ffmpeg'),
+            'encode_profile': self.encode_profile,
+            'crop_mode': self.config.get('crop_mode', 'smart'),
+            'caption_font': self.config.get('caption_font', 'Arial-Bold')
+        }
+    
+    def _crop_paths(self, segments, video_path):
+        """Analyze the clip windows of each wide source and return its smart crop path (sources left out get the centered crop)"""
+        crop_paths = {}
+        if self.config.get('crop_mode', 'smart') != 'smart':
+            return crop_paths
+        
+        start = time.perf_counter()
+        for source_path in dict.fromkeys(segment.get('source_path', video_path) for segment in segments):
+            try:
+                width, height = probe_media(source_path)['video_size']
+            except Exception as e:
+                logger.warning(f"Could not probe {source_path} for smart crop: {str(e)}")
+                continue
+            _, _, crop_width, _ = self._crop_box(width, height)
+            if crop_width < width:
+                # Only the clip windows are analyzed; a section file starts at source_offset
+                windows = [
+                    (segment['start_time'] - segment.get('source_offset', 0), segment['end_time'] - segment.get('source_offset', 0))
+                    for segment in segments if segment.get('source_path', video_path) == source_path
+                ]
+                # A section lives in a fresh scratch directory per render, so it is cached under the
+                # stored source it was cut from and its offset instead of its own path
+                cache_id = None
+                if source_path != video_path:
+                    offset = next(segment.get('source_offset', 0) for segment in segments if segment.get('source_path') == source_path)
+                    cache_id = f"{os.path.abspath(video_path)}@{offset:.3f}"
+                crop_paths[source_path] = self.smart_cropper.crop_path(source_path, crop_width / width, windows, cache_id)
+        if crop_paths:
+            logger.info(f"Smart crop paths for {len(crop_paths)} source(s) ready in {time.perf_counter() - start:.1f}s")
+        return crop_paths
+    
+    def _write_crop_commands(self, crop_path, segment, source_offset, source_width, crop_width, command_path, target):
+        """Write an ffmpeg sendcmd file that moves the named crop along the smart crop path, returning the first x and whether it moves"""
+        duration = segment['end_time'] - segment['start_time']
+        times = np.arange(0, duration, 1 / 30)
+        xs = crop_path.x_at(segment['start_time'] - source_offset + times, source_width, crop_width)
+        # One command per change of position rather than per frame
+        changes = np.flatnonzero(np.diff(xs)) + 1
+        if not len(changes):
+            return int(xs[0]), False
+        with open(command_path, 'w') as f:
+            for i in changes:
+                f.write(f"{times[i]:.3f} {target} x {xs[i]};\n")
+        return int(xs[0]), True
+    
+    def _clip_output_path(self, segment, output_path, index=0):
+        """Build the output file path for a rendered clip; the index keeps same-titled clips of one batch apart"""
+        output_filename = f"{segment['title'].replace(' ', '_')[:50]}_{int(time.time())}_{index}.mp4"
+        return os.path.join(output_path, output_filename)
+    
+    def _group_segments(self, indices, segments):
+        """Group segment indices from the same source whose time ranges lie close enough to share one decode"""
+        max_gap = self.config.get('render_batch_max_gap', 30)
+        groups = []
+        group_end = None
+        group_source = None
+        for i in sorted(indices, key=lambda i: (segments[i].get('source_path') or '', segments[i]['start_time'])):
+            source = segments[i].get('source_path')
+            if groups and source == group_source and segments[i]['start_time'] - group_end <= max_gap:
+                groups[-1].append(i)
+                group_end = max(group_end, segments[i]['end_time'])
             else:
-                # Video is taller, crop height
-                new_height = int(video.w / target_aspect)
-                video = video.crop(y_center=video.h/2, height=new_height)
-            
-            # Resize to target resolution
-            video = video.resize((target_width, target_height))
-            
-            # Extract relevant transcription segments
-            caption_clips = []
-            for trans_segment in transcription['segments']:
-                seg_start = trans_segment['start']
-                seg_end = trans_segment['end']
+                groups.append([i])
+                group_end = segments[i]['end_time']
+                group_source = source
+        return groups
+    
+    def _crop_box(self, width, height):
+        """Calculate the (x, y, width, height) crop that gives a centered 9:16 frame"""
+        target_aspect = TARGET_WIDTH / TARGET_HEIGHT
+        
+        if width / height > target_aspect:
+            # Video is wider, crop width
+            new_width = int(height * target_aspect)
+            return int(width / 2 - new_width / 2), 0, new_width, height
+        
+        # Video is taller, crop height
+        new_height = int(width / target_aspect)
+        return 0, int(height / 2 - new_height / 2), width, new_height
+    
+    def _caption_events(self, segment, transcription):
+        """Get (start, end, text) captions relative to the clip for overlapping transcription segments"""
+        events = []
+        # Only the transcription segments that overlap our video segment, found by binary search
+        for trans_segment in self.transcript_index(transcription).overlapping(segment['start_time'], segment['end_time']):
+            # Adjust timing relative to the clip
+            clip_start = max(0, trans_segment['start'] - segment['start_time'])
+            clip_end = min(segment['end_time'] - segment['start_time'], trans_segment['end'] - segment['start_time'])
+            
+            if clip_end > clip_start:
+                events.append((clip_start, clip_end, trans_segment['text'].strip()))
+        
+        return events
+    
+    def _write_ass_subtitles(self, events, subtitle_path, font_family, bold):
+        """Write caption events as an ASS file styled like the moviepy captions"""
+        lines = [
+            "[Script Info]",
+            "ScriptType: v4.00+",
+            f"PlayResX: {TARGET_WIDTH}",
+            f"PlayResY: {TARGET_HEIGHT}",
+            "WrapStyle: 0",
+            "ScaledBorderAndShadow: yes",
+            "",
+            "[V4+ Styles]",
+            "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+            "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, "
+            "Shadow, Alignment, MarginL, MarginR, MarginV, Encoding",
+            f"Style: Caption,{font_family.replace(',', ' ')},{CAPTION_FONT_SIZE},&H00FFFFFF,&H00FFFFFF,&H00000000,&H00000000,"
+            f"{-1 if bold else 0},0,0,0,100,100,0,0,1,{CAPTION_STROKE_WIDTH},0,2,{CAPTION_MARGIN},{CAPTION_MARGIN},0,1",
+            "",
+            "[Events]",
+            "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+        ]
+        for start, end, text in events:
+            text = text.replace('\\', '/').replace('{', '(').replace('}', ')').replace('\n', '\\N')
+            lines.append(
+                f"Dialogue: 0,{format_ass_timestamp(start)},{format_ass_timestamp(end)},Caption,,0,0,0,,{text}"
+            )
+        
+        with open(subtitle_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+    
+    def _profile_for(self, segment):
+        """Encode profile of one output; a segment may name its own profile"""
+        if segment.get('encode_profile'):
+            return resolve_profile(segment['encode_profile'], self.config.get('encode_calibration_path', 'encode_calibration.json'))[1]
+        return self.encode_profile
+    
+    def _render_group_with_ffmpeg(self, video_path, segments, transcription, output_paths, threads, crop_path=None):
+        """Render several clips from one ffmpeg process that decodes their shared source window once"""
+        info = probe_media(video_path)
+        x, y, crop_width, crop_height = self._crop_box(*info['video_size'])
+        
+        window_start = min(segment['start_time'] for segment in segments)
+        window_end = max(segment['end_time'] for segment in segments)
+        # Segment times are absolute; a section file starts at source_offset into the video
+        source_offset = segments[0].get('source_offset', 0)
+        count = len(segments)
+        
+        # Decode the window once and fan the frames out to one branch per clip
+        graph = [f"[0:v]split={count}" + ''.join(f"[v{i}]" for i in range(count))]
+        if info['audio_found']:
+            graph.append(f"[0:a]asplit={count}" + ''.join(f"[a{i}]" for i in range(count)))
+        
+        scratch_paths = []
+        output_args = []
+        try:
+            for i, (segment, final_output_path) in enumerate(zip(segments, output_paths)):
+                start = segment['start_time'] - window_start
+                end = segment['end_time'] - window_start
                 
-                # Check if this transcription segment overlaps with our video segment
-                if seg_start < segment['end_time'] and seg_end > segment['start_time']:
-                    # Adjust timing relative to the clip
-                    clip_start = max(0, seg_start - segment['start_time'])
-                    clip_end = min(segment['end_time'] - segment['start_time'], seg_end - segment['start_time'])
-                    
-                    if clip_end > clip_start:
-                        # Create caption
-                        caption_text = trans_segment['text'].strip()
-                        
-                        caption = TextClip(
-                            caption_text,
-                            fontsize=60,
-                            color='white',
-                            stroke_color='black',
-                            stroke_width=3,
-                            font='Arial-Bold',
-                            method='caption',
-                            size=(target_width - 100, None)
-                        ).set_position(('center', 'bottom')).set_start(clip_start).set_end(clip_end)
-                        
-                        caption_clips.append(caption)
-            
-            # Composite video with captions
-            if caption_clips:
-                final_video = CompositeVideoClip([video] + caption_clips)
-            else:
-                final_video = video
-            
-            # Write final video
-            output_filename = f"{segment['title'].replace(' ', '_')[:50]}_{int(time.time())}.mp4"
-            final_output_path = os.path.join(output_path, output_filename)
-            
-            final_video.write_videofile(
-                final_output_path,
-                codec='libx264',
-                audio_codec='aac',
-                temp_audiofile='temp-audio.m4a',
-                remove_temp=True,
-                fps=30
+                filters = [
+                    f"trim=start={start:.3f}:end={end:.3f}",
+                    "setpts=PTS-STARTPTS",
+                ]
+                if crop_path is not None:
+                    # Timestamps restart at zero after setpts, so commands are clip-relative.
+                    # sendcmd targets the first filter with a matching name, so each branch names its own crop.
+                    command_path = final_output_path[:-len('.mp4')] + '.cmd'
+                    scratch_paths.append(command_path)
+                    crop_x, moves = self._write_crop_commands(
+                        crop_path, segment, source_offset, info['video_size'][0], crop_width, command_path, f"crop@c{i}"
+                    )
+                    if moves:
+                        filters.append(f"sendcmd=f={escape_filter_path(command_path)}")
+                    filters.append(f"crop@c{i}={crop_width}:{crop_height}:{crop_x}:{y}")
+                else:
+                    filters.append(f"crop={crop_width}:{crop_height}:{x}:{y}")
+                filters += [
+                    f"scale={TARGET_WIDTH}:{TARGET_HEIGHT}",
+                    "setsar=1",
+                    "fps=30",
+                ]
+                
+                events = self._caption_events(segment, transcription)
+                if events:
+                    subtitle_path = final_output_path[:-len('.mp4')] + '.ass'
+                    # Same font file as the moviepy captions when Pillow found one
+                    font_family, bold, font_file = self.caption_renderer.font_face()
+                    self._write_ass_subtitles(events, subtitle_path, font_family, bold)
+                    scratch_paths.append(subtitle_path)
+                    subtitles = f"subtitles={escape_filter_path(subtitle_path)}"
+                    if font_file:
+                        subtitles += f":fontsdir={escape_filter_path(os.path.dirname(font_file))}"
+                    filters.append(subtitles)
+                
+                graph.append(f"[v{i}]" + ','.join(filters) + f"[vout{i}]")
+                output_args += ['-map', f"[vout{i}]"]
+                profile = self._profile_for(segment)
+                
+                if info['audio_found']:
+                    graph.append(f"[a{i}]atrim=start={start:.3f}:end={end:.3f},asetpts=PTS-STARTPTS[aout{i}]")
+                    output_args += ['-map', f"[aout{i}]"] + audio_args(profile)
+                
+                output_args += video_args(profile, threads) + [
+                    '-movflags', '+faststart',
+                    final_output_path
+                ]
+            
+            run_ffmpeg([
+                '-ss', f"{window_start - source_offset:.3f}",
+                '-t', f"{window_end - window_start:.3f}",
+                '-i', video_path,
+                '-filter_complex', ';'.join(graph),
+            ] + output_args)
+        except Exception:
+            for final_output_path in output_paths:
+                if os.path.exists(final_output_path):
+                    os.remove(final_output_path)
+            raise
+        finally:
+            for scratch_path in scratch_paths:
+                if os.path.exists(scratch_path):
+                    os.remove(scratch_path)
+    
+    def _render_with_moviepy(self, source, segment, transcription, final_output_path, crop_path=None):
+        """Render the clip by compositing moviepy clips frame by frame"""
+        # Cut the segment from the already opened source (a section file starts at source_offset)
+        source_offset = segment.get('source_offset', 0)
+        video = source.subclip(segment['start_time'] - source_offset, segment['end_time'] - source_offset)
+        
+        # Crop to vertical format (9:16) and resize to target resolution
+        x, y, crop_width, crop_height = self._crop_box(video.w, video.h)
+        if crop_path is not None:
+            # Move the crop window along the smart crop path, frame by frame
+            source_width = video.w
+            source_start = segment['start_time'] - source_offset
+            
+            def follow(get_frame, t):
+                frame = get_frame(t)
+                left = int(crop_path.x_at(source_start + t, source_width, crop_width))
+                return frame[y:y + crop_height, left:left + crop_width]
+            
+            video = video.fl(follow, apply_to=['mask'])
+            video.size = (crop_width, crop_height)
+        else:
+            video = video.crop(x1=x, y1=y, width=crop_width, height=crop_height)
+        video = video.resize((TARGET_WIDTH, TARGET_HEIGHT))
+        
+        # Create captions for the overlapping transcription segments
+        caption_clips = []
+        for clip_start, clip_end, caption_text in self._caption_events(segment, transcription):
+            rgba = self.caption_renderer.render(
+                caption_text,
+                TARGET_WIDTH - 2 * CAPTION_MARGIN,
+                fontsize=CAPTION_FONT_SIZE,
+                stroke_width=CAPTION_STROKE_WIDTH
             )
-            
-            # Clean up
-            video.close()
-            final_video.close()
-            for clip in caption_clips:
-                clip.close()
-            
-            return final_output_path
-            
-        except Exception as e:
-            logger.error(f"Error creating vertical video: {str(e)}")
-            return None
+            mask = ImageClip(rgba[:, :, 3] / 255.0, ismask=True)
+            caption = ImageClip(rgba[:, :, :3]).set_mask(mask)
+            caption = caption.set_position(('center', 'bottom')).set_start(clip_start).set_end(clip_end)
+            
+            caption_clips.append(caption)
+        
+        # Composite video with captions
+        if caption_clips:
+            final_video = CompositeVideoClip([video] + caption_clips)
+        else:
+            final_video = video
+        
+        # Write final video
+        final_video.write_videofile(
+            final_output_path,
+            # Next to the output so concurrent renders never share a temp file
+            temp_audiofile=os.path.splitext(final_output_path)[0] + '.temp-audio.m4a',
+            remove_temp=True,
+            fps=30,
+            **moviepy_kwargs(self._profile_for(segment))
+        )
+        
+        # Clean up (the source reader is shared and closed by the caller)
+        for clip in caption_clips:
+            clip.close()
+        
+        return final_output_path
+    
+    def _chat(self, prompt, temperature):
+        """Send one chat completion request and return the reply text, counting requests and latency"""
+        openai.api_key = self.config['openai_api_key']
+        if self.config.get('openai_api_base'):
+            openai.api_base = self.config['openai_api_base']
+        
+        start = time.time()
+        try:
+            response = openai.ChatCompletion.create(
+                model="gpt-3.5-turbo",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature
+            )
+        finally:
+            with self._stats_lock:
+                self.llm_stats['requests'] += 1
+                self.llm_stats['seconds'] += time.time() - start
+        return response.choices[0].message.content
+    
+    def _fallback_metadata(self, video_info, segment):
+        """Metadata built from the segment itself when the AI response is unusable"""
+        return {
+            'title': segment['title'],
+            'description': f"Clip dari {video_info['channel']} - {segment['reason']}",
+            'hashtags': ['#timothyronald', '#akademicrypto', '#crypto', '#finance', '#indonesia']
+        }
+    
+    def _validate_metadata(self, metadata):
+        """Check one clip's AI metadata and normalize it, raising ValueError when it is unusable"""
+        if not isinstance(metadata, dict):
+            raise ValueError("metadata is not an object")
+        title = metadata.get('title')
+        description = metadata.get('description', '')
+        if not isinstance(title, str) or not title.strip() or not isinstance(description, str):
+            raise ValueError("missing title or description")
+        
+        hashtags = metadata.get('hashtags', [])
+        if isinstance(hashtags, str):
+            hashtags = hashtags.split()
+        if not isinstance(hashtags, list):
+            raise ValueError("hashtags is not a list")
+        hashtags = [tag if tag.startswith('#') else f'#{tag}' for tag in hashtags if isinstance(tag, str) and tag.strip()]
+        
+        # Ensure required hashtags are included
+        required_hashtags = ['#timothyronald', '#akademicrypto']
+        for req_tag in required_hashtags:
+            if req_tag not in hashtags:
+                hashtags.append(req_tag)
+        
+        return {'title': title.strip()[:100], 'description': description.strip()[:300], 'hashtags': hashtags}
     
     def generate_tiktok_metadata(self, video_info, segment):
         """Generate title, description and hashtags for TikTok"""
-        try:
-            openai.api_key = self.config['openai_api_key']
-            
-            prompt = f"""
-            Create engaging TikTok metadata for this video clip:
+        return self.generate_tiktok_metadata_batch(video_info, [segment])[0]
+    
+    @timed('metadata')
+    def generate_tiktok_metadata_batch(self, video_info, segments):
+        """Generate TikTok metadata for every clip of a video with a single AI request"""
+        start = time.time()
+        clips_text = '\n'.join(
+            f"{i}. Segment: {segment['title']} | Reason: {segment['reason']}"
+            for i, segment in enumerate(segments)
+        )
+        prompt = f"""
+            Create engaging TikTok metadata for each of these clips from one video:
             
             Original Video Title: {video_info['title']}
             Channel: {video_info['channel']}
-            Segment: {segment['title']}
-            Reason: {segment['reason']}
             
-            Generate:
+            Clips:
+            {clips_text}
+            
+            For every clip generate:
             1. Catchy TikTok title (max 100 characters)
             2. Engaging description (max 300 characters)
             3. Relevant hashtags (include #timothyronald #akademicrypto and others related to crypto/finance)
             
-            Return as JSON with keys: title, description, hashtags
+            Return a JSON list with one object per clip, with keys: clip (the clip number), title, description, hashtags
             Make it engaging for Indonesian crypto/finance audience.
             """
-            
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.8
-            )
-            
-            metadata = json.loads(response.choices[0].message.content)
-            
-            # Ensure required hashtags are included
-            required_hashtags = ['#timothyronald', '#akademicrypto']
-            hashtags = metadata.get('hashtags', [])
-            
-            for req_tag in required_hashtags:
-                if req_tag not in hashtags:
-                    hashtags.append(req_tag)
-            
-            metadata['hashtags'] = hashtags
-            return metadata
-            
+        
+        by_clip = {}
+        try:
+            items = json.loads(self._chat(prompt, 0.8))
+            if isinstance(items, dict):
+                items = [items]
+            for position, item in enumerate(items):
+                clip = item.get('clip', position) if isinstance(item, dict) else position
+                by_clip.setdefault(int(clip), item)
         except Exception as e:
             logger.error(f"Error generating metadata: {str(e)}")
-            return {
-                'title': segment['title'],
-                'description': f"Clip dari {video_info['channel']} - {segment['reason']}",
-                'hashtags': ['#timothyronald', '#akademicrypto', '#crypto', '#finance', '#indonesia']
-            } 
\ No newline at end of file
+        
+        results = []
+        fallbacks = 0
+        for i, segment in enumerate(segments):
+            try:
+                results.append(self._validate_metadata(by_clip.get(i)))
+            except Exception as e:
+                if by_clip:
+                    logger.warning(f"Unusable metadata for clip {i} ({str(e)}), using fallback")
+                fallbacks += 1
+                results.append(self._fallback_metadata(video_info, segment))
+        
+        logger.info(
+            f"Generated metadata for {len(segments)} clips of {video_info['title']} with 1 request "
+            f"in {time.time() - start:.2f}s ({fallbacks} fallbacks)"
+        )
+        return results
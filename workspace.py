@@ -0,0 +1,158 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Entry files are named <kind>-<key>.<ext>; anything else in the directories is left alone
+ENTRY_PATTERN = re.compile(r'^(source|audio|clip)-[0-9a-f]{32}\.\w+$')
+
+STAGING_DIR = '.staging'
+
+
+class Workspace:
+    def __init__(self, config):
+        """Content-addressed store for sources, audio and rendered clips under one byte budget"""
+        self.roots = {
+            'source': config.get('download_path', './downloads'),
+            'audio': config.get('download_path', './downloads'),
+            'clip': config.get('output_path', './output')
+        }
+        self.max_bytes = config.get('workspace_max_mb', 20000) * 1024 * 1024
+        # Scratch directories can live on a tmpfs such as /dev/shm; empty means the system temp directory
+        self.scratch_root = config.get('scratch_path') or None
+        self.lock = threading.Lock()
+        # Pins are counted: an entry stays protected until every job that pinned it released it
+        self.pinned = Counter()
+        
+        for root in set(self.roots.values()):
+            os.makedirs(root, exist_ok=True)
+        if self.scratch_root:
+            os.makedirs(self.scratch_root, exist_ok=True)
+    
+    @staticmethod
+    def key(*parts):
+        """Address of an entry: a hash of everything that determines its bytes"""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:32]
+    
+    def owns(self, path):
+        """Check whether a path is an entry of this workspace"""
+        if not path:
+            return False
+        directory, name = os.path.split(os.path.abspath(path))
+        return bool(ENTRY_PATTERN.match(name)) and directory in {os.path.abspath(root) for root in self.roots.values()}
+    
+    def lookup(self, kind, key):
+        """Return the pinned path of a stored entry and mark it recently used, or None"""
+        prefix = f"{kind}-{key}."
+        for name in os.listdir(self.roots[kind]):
+            if name.startswith(prefix) and ENTRY_PATTERN.match(name):
+                entry_path = os.path.join(self.roots[kind], name)
+                try:
+                    os.utime(entry_path)
+                except FileNotFoundError:
+                    continue
+                self.pin(entry_path)
+                return entry_path
+        return None
+    
+    def store(self, kind, key, path):
+        """Move a finished file into the workspace under its key, pin it and evict to stay within the budget"""
+        extension = os.path.splitext(path)[1] or '.bin'
+        entry_path = os.path.join(self.roots[kind], f"{kind}-{key}{extension}")
+        # A rename when the file was staged on the same filesystem, a copy otherwise
+        shutil.move(path, entry_path)
+        self.pin(entry_path)
+        self.evict()
+        return entry_path
+    
+    def pin(self, path):
+        """Protect an entry (or staging directory) from eviction while a job uses it"""
+        with self.lock:
+            self.pinned[os.path.abspath(path)] += 1
+    
+    def release(self, path):
+        """Drop one pin; once none are left the entry stays on disk until the budget needs the space"""
+        path = os.path.abspath(path)
+        with self.lock:
+            self.pinned[path] -= 1
+            if self.pinned[path] <= 0:
+                del self.pinned[path]
+    
+    def _staging_entries(self):
+        """Return (mtime, size, path) of each staging directory, sized by the partial files inside it"""
+        staging_root = os.path.join(self.roots['source'], STAGING_DIR)
+        if not os.path.isdir(staging_root):
+            return []
+        entries = []
+        for name in os.listdir(staging_root):
+            path = os.path.join(staging_root, name)
+            mtime, size = 0.0, 0
+            for directory, _, files in os.walk(path):
+                for file_name in files:
+                    try:
+                        stat = os.stat(os.path.join(directory, file_name))
+                    except FileNotFoundError:
+                        continue
+                    mtime = max(mtime, stat.st_mtime)
+                    size += stat.st_size
+            entries.append((mtime, size, path))
+        return entries
+    
+    def evict(self):
+        """Remove the least recently used unpinned entries (and abandoned partial downloads) until the workspace fits in its budget"""
+        with self.lock:
+            entries = self._staging_entries()
+            for root in set(self.roots.values()):
+                for name in os.listdir(root):
+                    if not ENTRY_PATTERN.match(name):
+                        continue
+                    entry_path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(entry_path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry_path))
+            
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if os.path.abspath(entry_path) in self.pinned:
+                    continue
+                try:
+                    if os.path.isdir(entry_path):
+                        shutil.rmtree(entry_path)
+                    else:
+                        os.remove(entry_path)
+                    total -= size
+                    logger.info(f"Evicted {os.path.basename(entry_path)} from the workspace")
+                except FileNotFoundError:
+                    continue
+    
+    def staging_dir(self, name):
+        """Stable, pinned directory for a download in progress, next to the store so finished files move in by rename"""
+        path = os.path.join(self.roots['source'], STAGING_DIR, name)
+        os.makedirs(path, exist_ok=True)
+        self.pin(path)
+        return path
+    
+    def clear_staging(self, name):
+        """Remove a staging directory whose download was stored or given up on"""
+        shutil.rmtree(os.path.join(self.roots['source'], STAGING_DIR, name), ignore_errors=True)
+    
+    @contextmanager
+    def scratch(self, name):
+        """Unique per-job directory for intermediates, removed on exit"""
+        path = tempfile.mkdtemp(prefix=f"{name}-", dir=self.scratch_root)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)